@@ -1,11 +1,106 @@
-from collections import namedtuple, defaultdict
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
 from functools import lru_cache
 import numpy as np
 import itertools
+import heapq
+import math
+import threading
+import time
 
 Obstacle = namedtuple('Obstacle', 'up down left right')
 Point = namedtuple('Point', 'x y')
 Adjacency = namedtuple('Adjacency', 'distance point')
+CacheStatistics = namedtuple('CacheStatistics', 'hits misses evictions entries size')
+
+MAX_BLOCK_SIZE = 2 ** 18
+# Number of the closest obstacles tested first by find_blocked_points.
+ANGULAR_BATCH_SIZE = 16
+
+# PathfindingStatistics being collected (see collect_statistics) or None.
+active_statistics = None
+
+
+class PathfindingStatistics:
+    """
+    Collects counters and times of pathfinding stages.
+
+    Counters include numbers of nodes expanded and edges relaxed by
+    searches, segment-obstacle intersection tests performed, obstacles
+    skipped thanks to the obstacle grid, and cache hits and misses.
+    Times (in seconds) are summed for each stage: creating the
+    visibility graph, calculating visibility of endpoints and searching.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.stage_times = {}
+
+    def count(self, name, value=1):
+        """
+        Increases the counter with given name.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, stage, seconds):
+        """
+        Adds time spent in given stage.
+        """
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        """
+        Returns all counters and stage times in one dictionary (e.g. to be exported to a metrics system).
+        """
+        result = dict(self.counters)
+        result.update(('%s_time' % stage, seconds) for stage, seconds in self.stage_times.items())
+        return result
+
+
+@contextmanager
+def collect_statistics(callback=None):
+    """
+    Collects PathfindingStatistics of all pathfinding done inside the with block.
+
+    Yields the statistics object, which is filled in as the
+    calculations go. If callback is given, it is called with the
+    statistics at the end of the block. When no statistics are collected,
+    the pathfinding functions only check that, so the cost is negligible.
+    Statistics are collected from all threads.
+    """
+    global active_statistics
+    previous_statistics = active_statistics
+    statistics = active_statistics = PathfindingStatistics()
+    try:
+        yield statistics
+    finally:
+        active_statistics = previous_statistics
+        if callback is not None:
+            callback(statistics)
+
+
+def count_statistics(name, value=1):
+    """
+    Increases the counter with given name, if statistics are being collected.
+    """
+    if active_statistics is not None:
+        active_statistics.count(name, value)
+
+
+@contextmanager
+def measure_stage(stage):
+    """
+    Measures time spent in the with block as given stage, if statistics are being collected.
+    """
+    statistics = active_statistics
+    if statistics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        statistics.add_time(stage, time.perf_counter() - started)
 
 
 class Agent:
@@ -18,6 +113,9 @@ class Agent:
     value of size_y represents the distance from Agent's position to
     both the upper and lower side of that rectangle. Therefore, the
     dimension of the Agent's rectangle is (2*size_x, 2*size_y).
+
+    The path is stored as a list of waypoints and the index of the next
+    one, so reaching a waypoint does not shift the rest of the list.
     """
     def __init__(self, position, size_x, size_y, velocity=1.0):
         self.position = position
@@ -26,61 +124,1465 @@ class Agent:
         self.path = []
         self.velocity = velocity
 
-    def is_moving(self):
+    @property
+    def path(self):
+        """
+        The points of the path that the Agent has not reached yet (None if no path was found).
+
+        Returns a new list, so changing it does not change the path.
+        """
+        if self.waypoints is None:
+            return None
+        return self.waypoints[self.waypoint_index:]
+
+    @path.setter
+    def path(self, path):
+        self.waypoints = None if path is None else list(path)
+        self.waypoint_index = 0
+
+    def is_moving(self):
+        """
+        Checks if the Agent is moving (if he has a path to follow).
+        """
+        return self.waypoints is not None and self.waypoint_index < len(self.waypoints)
+
+    def calculate_new_path(self, destination, obstacles, use_visibility_field=False):
+        """
+        Calculates new path from Agent's current position to given destination and stores this path.
+
+        The inflated obstacles and their visibility graph are taken from
+        configuration_space_cache, so they are shared by all Agents of the same size.
+        If use_visibility_field is True, vertices visible from the position
+        and destination are found using a VisibilityField (also cached).
+        """
+        field = None
+        if use_visibility_field:
+            field = configuration_space_cache.get_visibility_field(obstacles, self.size_x, self.size_y)
+            obstacles, graph = field.obstacles, field.graph
+        else:
+            obstacles, graph = configuration_space_cache.get_configuration_space(obstacles, self.size_x, self.size_y)
+        self.path = find_paths_using_indexed_graph(
+            [(self.position, destination)], obstacles, graph, visibility_field=field)[0]
+
+    def create_obstacles_in_configuration_space(self, obstacles):
+        """
+        Creates new 'inflated' obstacles (see inflate_obstacles).
+
+        The obstacles are cached in configuration_space_cache.
+        """
+        return configuration_space_cache.get_obstacles(obstacles, self.size_x, self.size_y)
+
+    def move_along_path(self):
+        """
+        Moves the Agent and updates his path.
+
+        Takes the next point of current path. If that point is close enough
+        (within one velocity distance), moves the agent to that point and
+        advances to the next point of the path. Otherwise moves the agent
+        by one velocity distance toward that point.
+
+        If the path is empty, the method doesn't do anything.
+        """
+        if not self.is_moving():
+            return
+        next_point = self.waypoints[self.waypoint_index]
+        next_point_delta = np.subtract(next_point, self.position)
+        distance_to_next_point = np.linalg.norm(next_point_delta)
+
+        if distance_to_next_point < self.velocity:
+            self.position = next_point
+            self.waypoint_index += 1
+        else:
+            velocity_vector = np.multiply(next_point_delta, self.velocity / distance_to_next_point)
+            new_position = np.add(self.position, velocity_vector)
+            self.position = Point(*new_position)
+
+
+class Swarm:
+    """
+    Represents many Agents moving along their paths at once.
+
+    Positions and velocities of all Agents are kept in arrays, so that
+    step moves all of them with a few vectorized operations, instead
+    of calling Agent.move_along_path for each one. Agents are identified
+    by integer ids given by add_agent.
+
+    Paths of all Agents are stored in one array of waypoints. The current
+    waypoint of Agent i is waypoints[waypoint_index[i]] and its path ends
+    before waypoints[path_end[i]]. Reaching a waypoint only advances the
+    index, so no path is ever shifted. The arrays grow when needed
+    and the waypoints of old paths are dropped when the array is full.
+
+    If on_arrival is given, it is called with the id of each Agent
+    that reaches the end of its path.
+    """
+    def __init__(self, on_arrival=None):
+        self.agent_count = 0
+        self.positions = np.zeros((0, 2))
+        self.velocities = np.zeros(0)
+        self.waypoint_index = np.zeros(0, dtype=np.int64)
+        self.path_end = np.zeros(0, dtype=np.int64)
+        self.waypoint_count = 0
+        self.waypoints = np.zeros((0, 2))
+        self.on_arrival = on_arrival
+
+    def add_agent(self, position, velocity=1.0, path=()):
+        """
+        Adds an Agent at given position and returns its id.
+        """
+        if self.agent_count == len(self.velocities):
+            capacity = max(16, 2 * self.agent_count)
+            self.positions = grow_array(self.positions, capacity)
+            self.velocities = grow_array(self.velocities, capacity)
+            self.waypoint_index = grow_array(self.waypoint_index, capacity)
+            self.path_end = grow_array(self.path_end, capacity)
+        agent_id = self.agent_count
+        self.agent_count += 1
+        self.positions[agent_id] = position
+        self.velocities[agent_id] = velocity
+        self.set_path(agent_id, path)
+        return agent_id
+
+    def set_path(self, agent_id, path):
+        """
+        Replaces the path of the Agent with given id.
+        """
+        path = np.asarray(path, dtype=float).reshape(-1, 2)
+        if self.waypoint_count + len(path) > len(self.waypoints):
+            self.compact_waypoints(len(path))
+        first = self.waypoint_count
+        self.waypoints[first:first + len(path)] = path
+        self.waypoint_index[agent_id] = first
+        self.path_end[agent_id] = first + len(path)
+        self.waypoint_count += len(path)
+
+    def compact_waypoints(self, required_space):
+        """
+        Removes waypoints that are no longer used and makes room for at least required_space new ones.
+        """
+        first = self.waypoint_index[:self.agent_count]
+        lengths = self.path_end[:self.agent_count] - first
+        new_end = np.cumsum(lengths)
+        used = np.repeat(first - (new_end - lengths), lengths) + np.arange(new_end[-1] if len(lengths) else 0)
+        self.waypoints = grow_array(self.waypoints[used], max(16, 2 * (len(used) + required_space)))
+        self.waypoint_index[:self.agent_count] = new_end - lengths
+        self.path_end[:self.agent_count] = new_end
+        self.waypoint_count = len(used)
+
+    def step(self):
+        """
+        Moves all Agents along their paths (see Agent.move_along_path).
+
+        Returns an array of ids of the Agents that reached the end of their paths in this step.
+        """
+        moving = np.flatnonzero(self.waypoint_index[:self.agent_count] < self.path_end[:self.agent_count])
+        if not len(moving):
+            return moving
+        targets = self.waypoints[self.waypoint_index[moving]]
+        deltas = targets - self.positions[moving]
+        distances = np.hypot(deltas[:, 0], deltas[:, 1])
+        velocities = self.velocities[moving]
+        reached = distances < velocities
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factors = np.where(reached, 1.0, velocities / distances)
+        self.positions[moving] += deltas * factors[:, np.newaxis]
+        self.positions[moving[reached]] = targets[reached]
+        self.waypoint_index[moving[reached]] += 1
+
+        arrived = moving[reached]
+        arrived = arrived[self.waypoint_index[arrived] == self.path_end[arrived]]
+        if self.on_arrival is not None:
+            for agent_id in arrived.tolist():
+                self.on_arrival(agent_id)
+        return arrived
+
+    def is_moving(self, agent_id):
+        """
+        Checks if the Agent with given id is moving (if it has a path to follow).
+        """
+        return bool(self.waypoint_index[agent_id] < self.path_end[agent_id])
+
+    def get_position(self, agent_id):
+        """
+        Returns the position of the Agent with given id.
+        """
+        return Point(*self.positions[agent_id].tolist())
+
+    def get_path(self, agent_id):
+        """
+        Returns the rest of the path of the Agent with given id.
+        """
+        waypoints = self.waypoints[self.waypoint_index[agent_id]:self.path_end[agent_id]]
+        return [Point(x, y) for x, y in waypoints.tolist()]
+
+
+class ConfigurationSpaceCache:
+    """
+    Stores inflated obstacles and their visibility graphs for Agents of different sizes.
+
+    Entries are identified by the original obstacles and the size of
+    an Agent (size_x, size_y), so all Agents of the same size share
+    one entry. The visibility graph (and VisibilityField) of an entry
+    is created when it is first needed. The size of entries (in bytes) is estimated and when
+    their total size exceeds max_size, the least recently used entries
+    are removed. The most recently used entry is never removed.
+    """
+    # Approximate size of one Obstacle with float coordinates.
+    OBSTACLE_SIZE = 200
+
+    def __init__(self, max_size=256 * 2 ** 20):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_obstacles(self, obstacles, size_x, size_y):
+        """
+        Returns given obstacles inflated by the size of an Agent.
+        """
+        entry = self.find_entry(obstacles, size_x, size_y)
+        self.count_lookup(entry is not None)
+        if entry is None:
+            entry = self.add_entry(obstacles, size_x, size_y)
+        return entry['obstacles']
+
+    def get_configuration_space(self, obstacles, size_x, size_y):
+        """
+        Returns given obstacles inflated by the size of an Agent and an IndexedVisibilityGraph for them.
+        """
+        entry = self.find_entry(obstacles, size_x, size_y)
+        self.count_lookup(entry is not None and entry['graph'] is not None)
+        if entry is None:
+            entry = self.add_entry(obstacles, size_x, size_y)
+        if entry['graph'] is None:
+            with measure_stage('visibility_graph'):
+                entry['graph'] = create_indexed_visibility_graph(entry['obstacles'])
+            graph_size = sum(array.nbytes for array in entry['graph'].get_arrays().values())
+            entry['size'] += graph_size
+            self.size += graph_size
+            self.remove_old_entries()
+        return entry['obstacles'], entry['graph']
+
+    def get_visibility_field(self, obstacles, size_x, size_y):
+        """
+        Returns a VisibilityField for given obstacles inflated by the size of an Agent.
+        """
+        inflated_obstacles, graph = self.get_configuration_space(obstacles, size_x, size_y)
+        entry = self.find_entry(obstacles, size_x, size_y)
+        if entry['visibility_field'] is None:
+            with measure_stage('visibility_field'):
+                entry['visibility_field'] = VisibilityField(inflated_obstacles, graph)
+            field = entry['visibility_field']
+            field_size = field.cell_offsets.nbytes + field.cell_vertex_ids.nbytes
+            entry['size'] += field_size
+            self.size += field_size
+            self.remove_old_entries()
+        return entry['visibility_field']
+
+    def find_entry(self, obstacles, size_x, size_y):
+        """
+        Returns the entry for given obstacles and size of an Agent (or None) and marks it as recently used.
+        """
+        key = (obstacles, size_x, size_y)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def add_entry(self, obstacles, size_x, size_y):
+        """
+        Creates and returns the entry for given obstacles and size of an Agent.
+        """
+        entry = {
+            'obstacles': inflate_obstacles(obstacles, size_x, size_y),
+            'graph': None,
+            'visibility_field': None,
+            'size': len(obstacles) * self.OBSTACLE_SIZE,
+        }
+        self.entries[(obstacles, size_x, size_y)] = entry
+        self.size += entry['size']
+        self.remove_old_entries()
+        return entry
+
+    def count_lookup(self, is_hit):
+        """
+        Updates the statistics after a lookup.
+        """
+        if is_hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        count_statistics('configuration_space_cache_hits' if is_hit else 'configuration_space_cache_misses')
+
+    def remove_old_entries(self):
+        """
+        Removes the least recently used entries until the total size does not exceed max_size.
+        """
+        while self.size > self.max_size and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry['size']
+            self.evictions += 1
+
+    def get_statistics(self):
+        """
+        Returns the numbers of hits, misses and evictions, and the current number and size of entries.
+        """
+        return CacheStatistics(self.hits, self.misses, self.evictions, len(self.entries), self.size)
+
+    def clear(self):
+        """
+        Removes all entries (statistics are kept).
+        """
+        self.entries.clear()
+        self.size = 0
+
+
+# Cache shared by all Agents.
+configuration_space_cache = ConfigurationSpaceCache()
+
+
+class PathCache:
+    """
+    Stores paths found for repeated queries (see find_path).
+
+    Paths are identified by obstacles, the way the visibility graph is
+    created, start and destination. At most max_entries paths are kept;
+    the least recently used ones are removed first. Obstacles are
+    immutable, so a changed map is simply a new key. The paths
+    for the old map are removed with invalidate or when they get old.
+
+    If snap_size is given, start and destination are snapped to cells
+    of a grid of that size, so that queries between nearby points share
+    one entry. A path found for other points is only reused if its
+    first and last segments, moved to the new start and destination,
+    do not cross any obstacle. Otherwise the path is calculated again.
+    If shortcut_paths is True, the reused paths are shortened with shortcut_path.
+    """
+    def __init__(self, max_entries=1024, snap_size=None, shortcut_paths=False):
+        self.max_entries = max_entries
+        self.snap_size = snap_size
+        self.shortcut_paths = shortcut_paths
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def find_path(self, start, destination, obstacles, method='pairwise', reduced=False):
+        """
+        Returns the path between start and destination, calculating it only if it is not cached.
+        """
+        key = (obstacles, method, reduced, self.snap(start), self.snap(destination))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            path = self.reuse_path(entry, start, destination, obstacles)
+            if path is not None or entry[:2] == (start, destination):
+                self.hits += 1
+                count_statistics('path_cache_hits')
+                return path
+        self.misses += 1
+        count_statistics('path_cache_misses')
+        path = find_path(start, destination, obstacles, method, reduced)
+        self.entries[key] = (start, destination, path)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return None if path is None else list(path)
+
+    def snap(self, point):
+        """
+        Returns the part of the cache key identifying given point.
+        """
+        if self.snap_size is None:
+            return point
+        return math.floor(point.x / self.snap_size), math.floor(point.y / self.snap_size)
+
+    def reuse_path(self, entry, start, destination, obstacles):
+        """
+        Returns a copy of the cached path adjusted to start and destination (or None if it cannot be reused).
+        """
+        cached_start, cached_destination, path = entry
+        if (cached_start, cached_destination) == (start, destination):
+            return None if path is None else list(path)
+        if not path:
+            return None
+        path = path[:-1] + [destination]
+        blocked = get_obstacle_grid(obstacles).find_blocked_segments(
+            [start, path[-2] if len(path) > 1 else start], [path[0], destination])
+        if blocked.any():
+            return None
+        return shortcut_path(start, path, obstacles) if self.shortcut_paths else path
+
+    def invalidate(self, obstacles=None):
+        """
+        Removes the paths cached for given obstacles (or all the paths).
+        """
+        if obstacles is None:
+            self.entries.clear()
+            return
+        for key in [key for key in self.entries if key[0] == obstacles]:
+            del self.entries[key]
+
+    def get_statistics(self):
+        """
+        Returns the numbers of hits, misses and evictions, and the current number of cached paths.
+        """
+        return CacheStatistics(self.hits, self.misses, self.evictions, len(self.entries), len(self.entries))
+
+
+class World:
+    """
+    Represents a set of obstacles that can change over time, together with its visibility graph.
+
+    Unlike the graphs created by create_visibility_graph_for_obstacles,
+    the graph of a World is repaired after each change instead of being
+    created again. Each obstacle gets an id when it is added, which is
+    later used to remove it. The version is increased after each change.
+    """
+    def __init__(self, obstacles=()):
+        self.obstacles = dict(enumerate(obstacles))
+        self.next_obstacle_id = len(self.obstacles)
+        self.version = 0
+        self.vertex_owners = {}
+        for obstacle in self.obstacles.values():
+            for corner in get_obstacle_corners(obstacle):
+                self.vertex_owners[corner] = self.vertex_owners.get(corner, 0) + 1
+        graph = create_visibility_graph_for_obstacles(self.get_obstacles())
+        self.adjacencies = {
+            point: {adjacency.point: adjacency.distance for adjacency in adjacencies}
+            for point, adjacencies in graph.items()}
+
+    def get_obstacles(self):
+        """
+        Returns a tuple of current obstacles.
+        """
+        return tuple(self.obstacles.values())
+
+    def get_visibility_graph(self):
+        """
+        Returns current visibility graph, in the format used by create_visibility_graph_for_obstacles.
+        """
+        return WorldGraphView(self.adjacencies)
+
+    def add_obstacle(self, obstacle):
+        """
+        Adds an obstacle and returns its id.
+
+        Only the edges crossing the new obstacle are removed from the
+        graph and only the corners of the new obstacle are connected
+        to the rest of the graph. Both are limited to the vertices that
+        might see the new obstacle (see find_vertices_seeing_obstacle).
+        """
+        candidates = self.find_vertices_seeing_obstacle(obstacle, self.get_obstacles())
+        obstacle_id = self.next_obstacle_id
+        self.next_obstacle_id += 1
+        self.obstacles[obstacle_id] = obstacle
+        self.version += 1
+
+        candidate_set = set(candidates)
+        edges = [(p1, p2) for p1 in candidates for p2 in self.adjacencies[p1] if p1 < p2 and p2 in candidate_set]
+        if edges:
+            starts, ends = zip(*edges)
+            crossed = segments_cross_paired_obstacles(
+                np.array(starts, dtype=float), np.array(ends, dtype=float), get_obstacle_array((obstacle, )))
+            for i in np.flatnonzero(crossed):
+                p1, p2 = edges[i]
+                del self.adjacencies[p1][p2]
+                del self.adjacencies[p2][p1]
+
+        obstacles = self.get_obstacles()
+        for corner in get_obstacle_corners(obstacle):
+            self.vertex_owners[corner] = self.vertex_owners.get(corner, 0) + 1
+            if corner not in self.adjacencies:
+                self.connect_vertex(corner, candidates, obstacles)
+                candidates.append(corner)
+        return obstacle_id
+
+    def remove_obstacle(self, obstacle_id):
+        """
+        Removes the obstacle with given id and returns it.
+
+        Corners used only by the removed obstacle are removed from the
+        graph. Only the pairs of vertices that might see the removed
+        obstacle and whose connection crossed it are tested against
+        the remaining obstacles.
+        """
+        obstacle = self.obstacles.pop(obstacle_id)
+        self.version += 1
+
+        for corner in get_obstacle_corners(obstacle):
+            self.vertex_owners[corner] -= 1
+            if not self.vertex_owners[corner]:
+                del self.vertex_owners[corner]
+                for adjacent_point in self.adjacencies.pop(corner):
+                    del self.adjacencies[adjacent_point][corner]
+
+        obstacles = self.get_obstacles()
+        vertices = self.find_vertices_seeing_obstacle(obstacle, obstacles)
+        coordinates = np.array(vertices, dtype=float).reshape(-1, 2)
+        obstacle_array = get_obstacle_array((obstacle, ))
+        pairs = []
+        for i in range(len(vertices) - 1):
+            crossed = segments_cross_paired_obstacles(coordinates[i], coordinates[i + 1:], obstacle_array)
+            pairs.extend((i, j) for j in (i + 1 + np.flatnonzero(crossed)).tolist())
+        if pairs:
+            first, second = np.array(pairs).T
+            blocked = get_obstacle_grid(obstacles).find_blocked_segments(coordinates[first], coordinates[second])
+            for i, j in zip(first[~blocked].tolist(), second[~blocked].tolist()):
+                self.add_edge(vertices[i], vertices[j])
+        return obstacle
+
+    def find_vertices_seeing_obstacle(self, obstacle, obstacles):
+        """
+        Returns a list of vertices of the graph that might see a part of given obstacle.
+
+        Only those vertices can be connected by a segment crossing the
+        obstacle without crossing any of the other obstacles. A vertex
+        is left out only if one of the other obstacles blocks its view
+        of all 4 corners: the part of the plane hidden by a rectangle
+        is convex, so then the whole obstacle is hidden by it.
+        """
+        vertices = list(self.adjacencies)
+        hidden = get_obstacle_grid(obstacles).find_points_hidden_from_rectangle(vertices, obstacle)
+        return [vertex for vertex, is_hidden in zip(vertices, hidden) if not is_hidden]
+
+    def connect_vertex(self, point, other_points, obstacles):
+        """
+        Adds point to the graph and connects it to all visible points from other_points.
+        """
+        self.adjacencies[point] = {}
+        if other_points:
+            blocked = get_obstacle_grid(obstacles).find_blocked_segments(point, other_points)
+            for other_point, is_blocked in zip(other_points, blocked):
+                if not is_blocked:
+                    self.add_edge(point, other_point)
+
+    def add_edge(self, point1, point2):
+        """
+        Adds an edge between two vertices of the graph.
+        """
+        distance = np.linalg.norm(np.subtract(point1, point2))
+        self.adjacencies[point1][point2] = distance
+        self.adjacencies[point2][point1] = distance
+
+    def find_path(self, start, destination):
+        """
+        Calculates the path between start and destination, avoiding current obstacles (see find_path).
+        """
+        obstacles = self.get_obstacles()
+        visibility_graph = VisibilityGraphOverlay(self.get_visibility_graph())
+        add_vertex_to_visibility_graph(start, obstacles, visibility_graph)
+        add_vertex_to_visibility_graph(destination, obstacles, visibility_graph)
+        return find_path_using_visibility_graph(start, destination, visibility_graph)
+
+
+class WorldGraphView(Mapping):
+    """
+    Presents the adjacencies of a World (dictionaries of distances) as lists of Adjacency tuples.
+    """
+    def __init__(self, adjacencies):
+        self.adjacencies = adjacencies
+
+    def __getitem__(self, point):
+        return [Adjacency(distance, adjacent_point) for adjacent_point, distance in self.adjacencies[point].items()]
+
+    def __contains__(self, point):
+        return point in self.adjacencies
+
+    def __iter__(self):
+        return iter(self.adjacencies)
+
+    def __len__(self):
+        return len(self.adjacencies)
+
+
+class VisibilityGraphOverlay(Mapping):
+    """
+    Represents a visibility graph made of a base graph and additional adjacencies.
+
+    The base graph (a dictionary) is never modified. New vertices
+    and adjacencies (like the ones for start and destination) are
+    stored in the overlay. Adjacencies of a vertex are the ones from
+    the base graph followed by the ones from the overlay.
+    """
+    def __init__(self, base_graph):
+        self.base_graph = base_graph
+        self.overlay = {}
+
+    def __getitem__(self, point):
+        added_adjacencies = self.overlay.get(point)
+        if point not in self.base_graph:
+            if added_adjacencies is None:
+                raise KeyError(point)
+            return added_adjacencies
+        base_adjacencies = self.base_graph[point]
+        return base_adjacencies + added_adjacencies if added_adjacencies else base_adjacencies
+
+    def __contains__(self, point):
+        return point in self.base_graph or point in self.overlay
+
+    def __iter__(self):
+        yield from self.base_graph
+        yield from (point for point in self.overlay if point not in self.base_graph)
+
+    def __len__(self):
+        return len(self.base_graph) + sum(1 for point in self.overlay if point not in self.base_graph)
+
+    def __setitem__(self, point, adjacencies):
+        self.overlay[point] = adjacencies
+
+    def setdefault(self, point, default=None):
+        """
+        Returns the list of adjacencies of point stored in the overlay, creating it if necessary.
+        """
+        return self.overlay.setdefault(point, default)
+
+
+class ObstacleGrid:
+    """
+    Represents a uniform grid of cells covering given obstacles.
+
+    Each cell stores the indices of obstacles overlapping it. To find
+    obstacles that might be crossed by a segment, the grid is traversed
+    along that segment (using a DDA algorithm) and only the obstacles
+    from visited cells are considered. This way the cost of testing
+    a segment depends on the number of obstacles near it, not on the
+    total number of obstacles.
+
+    The grid covers the bounding box of obstacles. If bounds (left, up,
+    right, down) are given, it covers them as well.
+    """
+    def __init__(self, obstacles, cell_size=None, bounds=None):
+        self.obstacle_array = get_obstacle_array(obstacles)
+        up, down, left, right = self.obstacle_array.T
+        if not len(obstacles) and bounds is None:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self.shape = (1, 1)
+            self.cell_offsets = np.zeros(2, dtype=int)
+            self.cell_obstacles = np.zeros(0, dtype=int)
+            return
+
+        if bounds is None:
+            bounds = (np.inf, np.inf, -np.inf, -np.inf)
+        self.origin = np.array([left.min(initial=bounds[0]), up.min(initial=bounds[1])])
+        extent = np.array([right.max(initial=bounds[2]), down.max(initial=bounds[3])]) - self.origin
+        if cell_size is None and not len(obstacles):
+            cell_size = max(extent.max(), 1e-9)
+        elif cell_size is None:
+            mean_obstacle_size = np.mean(np.maximum(right - left, down - up))
+            cell_size = max(mean_obstacle_size, np.sqrt(extent.prod() / len(obstacles)), 1e-9)
+        self.cell_size = float(cell_size)
+        self.shape = tuple(np.maximum(np.ceil(extent / self.cell_size).astype(int), 1))
+
+        # Obstacles are slightly enlarged, so that rounding errors in
+        # the traversal never skip a cell containing a crossed obstacle.
+        margin = self.cell_size * 1e-6
+        first_x, last_x = self.cell_coordinates(left - margin, right + margin, 0)
+        first_y, last_y = self.cell_coordinates(up - margin, down + margin, 1)
+        cells = [
+            x * self.shape[1] + y
+            for i in range(len(obstacles))
+            for x in range(first_x[i], last_x[i] + 1)
+            for y in range(first_y[i], last_y[i] + 1)]
+        obstacle_indices = np.repeat(
+            np.arange(len(obstacles)), (last_x - first_x + 1) * (last_y - first_y + 1))
+        order = np.argsort(cells, kind='stable')
+        self.cell_obstacles = obstacle_indices[order]
+        self.cell_offsets = np.concatenate([[0], np.cumsum(
+            np.bincount(cells, minlength=self.shape[0] * self.shape[1]))])
+
+    def cell_coordinates(self, low, high, axis):
+        """
+        Returns indices of cells containing given low and high coordinates along given axis.
+        """
+        size = self.shape[axis] - 1
+        first = np.clip(np.floor((low - self.origin[axis]) / self.cell_size), 0, size).astype(int)
+        last = np.clip(np.floor((high - self.origin[axis]) / self.cell_size), 0, size).astype(int)
+        return first, last
+
+    def find_blocked_segments(self, starts, ends):
+        """
+        Checks which segments from starts to ends cross any obstacle.
+
+        Starts can be either one point (shared by all segments) or
+        a sequence of points of the same length as ends. Returns
+        a boolean array with one value per segment. The result is
+        the same as testing the segments against all obstacles.
+        """
+        ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+        starts = np.broadcast_to(np.asarray(starts, dtype=float), ends.shape)
+        blocked = np.zeros(len(ends), dtype=bool)
+        if not len(self.cell_obstacles):
+            return blocked
+        block_length = max(1, MAX_BLOCK_SIZE // (4 * sum(self.shape)))
+        for block_start in range(0, len(ends), block_length):
+            block = slice(block_start, block_start + block_length)
+            segments, obstacles = self.find_candidates(starts[block], ends[block])
+            count_statistics('obstacles_culled', len(ends[block]) * len(self.obstacle_array) - len(segments))
+            crosses = segments_cross_paired_obstacles(
+                starts[block][segments], ends[block][segments], self.obstacle_array[obstacles])
+            blocked[block_start + segments[crosses]] = True
+        return blocked
+
+    def find_points_inside_obstacles(self, points):
+        """
+        Checks which points lie inside any obstacle.
+
+        Points on the sides of obstacles are not considered to be inside.
+        Only the obstacles from the cell containing each point are tested.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        inside = np.zeros(len(points), dtype=bool)
+        if not len(self.cell_obstacles):
+            return inside
+        x, _ = self.cell_coordinates(points[:, 0], points[:, 0], 0)
+        y, _ = self.cell_coordinates(points[:, 1], points[:, 1], 1)
+        cells = x * self.shape[1] + y
+        first = self.cell_offsets[cells]
+        counts = self.cell_offsets[cells + 1] - first
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        point_indices = np.repeat(np.arange(len(points)), counts)
+        up, down, left, right = self.obstacle_array[self.cell_obstacles[np.repeat(first, counts) + offsets]].T
+        px, py = points[point_indices].T
+        contains = (left < px) & (px < right) & (up < py) & (py < down)
+        inside[point_indices[contains]] = True
+        return inside
+
+    def find_points_hidden_from_rectangle(self, points, rectangle):
+        """
+        Checks which points have their view of the whole rectangle blocked by a single obstacle.
+
+        A point is found hidden if one obstacle is crossed by all the
+        segments from the point to the corners of the rectangle. Points
+        hidden only by several obstacles together are not found.
+
+        The part of the plane hidden by an obstacle is convex, so such an
+        obstacle is also crossed by the segment to the rectangle's center.
+        Only the obstacles found along that segment are tested.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        hidden = np.zeros(len(points), dtype=bool)
+        if not len(self.cell_obstacles):
+            return hidden
+        corners = np.array(get_obstacle_corners(rectangle), dtype=float)
+        center = corners.mean(axis=0)
+        block_length = max(1, MAX_BLOCK_SIZE // (4 * sum(self.shape)))
+        for block_start in range(0, len(points), block_length):
+            block = points[block_start:block_start + block_length]
+            segments, obstacles = self.find_candidates(block, np.broadcast_to(center, block.shape))
+            crosses = np.ones(len(segments), dtype=bool)
+            for corner in corners:
+                crosses &= segments_cross_paired_obstacles(block[segments], corner, self.obstacle_array[obstacles])
+            hidden[block_start + segments[crosses]] = True
+        return hidden
+
+    def find_candidates(self, starts, ends):
+        """
+        Finds the obstacles that might be crossed by segments from starts to ends.
+
+        Returns two arrays of equal length: indices of segments and
+        indices of obstacles found in cells visited by those segments.
+        Each (segment, obstacle) pair is returned only once.
+        """
+        d = ends - starts
+        grid_end = self.origin + np.array(self.shape) * self.cell_size
+
+        # Clip the segments to the grid, as in the Liang-Barsky algorithm.
+        t_enter = np.zeros(len(ends))
+        t_exit = np.ones(len(ends))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis in range(2):
+                t1 = (self.origin[axis] - starts[:, axis]) / d[:, axis]
+                t2 = (grid_end[axis] - starts[:, axis]) / d[:, axis]
+                parallel = d[:, axis] == 0
+                inside = (self.origin[axis] <= starts[:, axis]) & (starts[:, axis] <= grid_end[axis])
+                t_enter = np.where(parallel, t_enter, np.maximum(t_enter, np.minimum(t1, t2)))
+                t_exit = np.where(parallel, np.where(inside, t_exit, -1), np.minimum(t_exit, np.maximum(t1, t2)))
+        active = np.flatnonzero(t_enter <= t_exit)
+
+        starts = starts[active]
+        entry = starts + d[active] * t_enter[active, np.newaxis]
+        cell = np.stack([
+            self.cell_coordinates(entry[:, axis], entry[:, axis], axis)[0] for axis in range(2)], axis=1)
+        step = np.sign(d[active]).astype(int)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            next_boundary = self.origin + (cell + (step > 0)) * self.cell_size
+            t_max = np.where(step != 0, (next_boundary - starts) / d[active], np.inf)
+            t_delta = np.where(step != 0, self.cell_size / np.abs(d[active]), np.inf)
+        t_exit = t_exit[active]
+
+        visited_segments = []
+        visited_cells = []
+        while len(active):
+            visited_segments.append(active)
+            visited_cells.append(cell[:, 0] * self.shape[1] + cell[:, 1])
+            axis = (t_max[:, 1] < t_max[:, 0]).astype(int)
+            rows = np.arange(len(active))
+            cell[rows, axis] += step[rows, axis]
+            t_next = t_max[rows, axis]
+            t_max[rows, axis] += t_delta[rows, axis]
+            keep = (t_next <= t_exit) & (cell[:, 0] >= 0) & (cell[:, 0] < self.shape[0]) & \
+                (cell[:, 1] >= 0) & (cell[:, 1] < self.shape[1])
+            active, cell, step, t_max, t_delta, t_exit = (
+                a[keep] for a in (active, cell, step, t_max, t_delta, t_exit))
+        if not visited_segments:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        visited_segments = np.concatenate(visited_segments)
+        visited_cells = np.concatenate(visited_cells)
+        first = self.cell_offsets[visited_cells]
+        counts = self.cell_offsets[visited_cells + 1] - first
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        obstacles = self.cell_obstacles[np.repeat(first, counts) + offsets]
+        pairs = np.unique(np.repeat(visited_segments, counts) * len(self.obstacle_array) + obstacles)
+        return pairs // len(self.obstacle_array), pairs % len(self.obstacle_array)
+
+
+class IndexedVisibilityGraph:
+    """
+    Represents a visibility graph for obstacles with vertices identified by integer ids.
+
+    Adjacencies are stored in compressed sparse row format: ids of
+    vertices adjacent to the vertex with id i are stored in
+    neighbour_ids[offsets[i]:offsets[i + 1]] and distances to them
+    in the same range of distances. Since the graph is kept in a few
+    flat arrays, it can be easily shared between processes. It also
+    takes several times less memory than a dictionary of Adjacency
+    tuples: each edge costs only 12 bytes (32-bit id and a distance)
+    in each direction.
+    """
+    def __init__(self, coordinates, offsets, neighbour_ids, distances, nodes=None):
+        self.coordinates = coordinates
+        self.offsets = offsets
+        self.neighbour_ids = neighbour_ids
+        self.distances = distances
+        if nodes is None:
+            nodes = [Point(x, y) for x, y in coordinates.tolist()]
+        self.nodes = nodes
+        self.node_ids = {node: i for i, node in enumerate(nodes)}
+        self.component_ids = None
+
+    def get_adjacencies(self, node_id):
+        """
+        Returns a list of (distance, id) tuples for vertices adjacent to the vertex with given id.
+        """
+        first, last = self.offsets[node_id], self.offsets[node_id + 1]
+        return list(zip(self.distances[first:last].tolist(), self.neighbour_ids[first:last].tolist()))
+
+    def get_component_ids(self):
+        """
+        Returns an array of ids of connected components of vertices.
+
+        Two vertices have the same component id if there is a path between
+        them. The ids are calculated when they are first needed and then kept
+        with the graph. Each vertex starts in its own component. In every
+        round, components joined by an edge are attached to the one with
+        the lowest id and the ids are propagated to all their vertices.
+        """
+        if self.component_ids is None:
+            rows = np.repeat(np.arange(len(self.nodes)), np.diff(self.offsets))
+            component_ids = np.arange(len(self.nodes))
+            while True:
+                new_component_ids = component_ids.copy()
+                np.minimum.at(new_component_ids, component_ids[rows], component_ids[self.neighbour_ids])
+                while True:
+                    parent_ids = new_component_ids[new_component_ids]
+                    if np.array_equal(parent_ids, new_component_ids):
+                        break
+                    new_component_ids = parent_ids
+                if np.array_equal(new_component_ids, component_ids):
+                    break
+                component_ids = new_component_ids
+            self.component_ids = component_ids
+        return self.component_ids
+
+    def find_components(self, adjacencies):
+        """
+        Returns a set of ids of components containing vertices from a list of (distance, id) tuples.
+        """
+        component_ids = self.get_component_ids()
+        return set(component_ids[[i for _, i in adjacencies]].tolist())
+
+    def get_arrays(self):
+        """
+        Returns a dictionary of arrays that can be used to recreate the graph.
+        """
+        return {
+            'coordinates': self.coordinates,
+            'offsets': self.offsets,
+            'neighbour_ids': self.neighbour_ids,
+            'distances': self.distances,
+        }
+
+
+class LazyVisibilityGraph:
+    """
+    Represents a visibility graph whose edges are found only when they are needed.
+
+    It can be used instead of an IndexedVisibilityGraph, with the same
+    vertex ids. Neighbours of a vertex are found the first time they are
+    requested (usually when a search expands that vertex) and kept for
+    later searches, so the first path can be found without creating the
+    whole graph. When neighbours of a vertex are found, that vertex is
+    also remembered as a neighbour of all vertices that were not expanded
+    yet, so every pair of vertices is tested only once.
+
+    The remaining vertices can be expanded with warm_up, also in a
+    background thread while searches are running. Once all vertices are
+    expanded, the graph is converted to an IndexedVisibilityGraph, which
+    is used from then on. Connected components are known only then,
+    so before that no query is rejected because of them.
+    """
+    def __init__(self, obstacles, method='pairwise', reduced=False):
+        if method not in ('pairwise', 'angular'):
+            raise ValueError('Unknown visibility graph method: %r' % (method,))
+        self.obstacles = obstacles
+        self.method = method
+        self.reduced = reduced
+        self.nodes = sorted(get_graph_vertices(obstacles, reduced))
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        self.coordinates = np.array(self.nodes, dtype=float).reshape(-1, 2)
+        self.adjacencies = [None] * len(self.nodes)
+        # Neighbours found while expanding other vertices, for vertices not expanded yet.
+        self.found_adjacencies = [[] for _ in self.nodes]
+        self.expanded = np.zeros(len(self.nodes), dtype=bool)
+        self.expanded_count = 0
+        self.indexed_graph = None
+        if not self.nodes:
+            self.indexed_graph = create_indexed_graph_from_adjacencies(self.coordinates, [], self.nodes)
+        self.lock = threading.Lock()
+
+    def get_adjacencies(self, node_id):
+        """
+        Returns a list of (distance, id) tuples for vertices adjacent to the vertex with given id.
+        """
+        indexed_graph = self.indexed_graph
+        if indexed_graph is None:
+            with self.lock:
+                indexed_graph = self.indexed_graph
+                if indexed_graph is None:
+                    if self.adjacencies[node_id] is None:
+                        self.expand(node_id)
+                    return list(self.adjacencies[node_id])
+        return indexed_graph.get_adjacencies(node_id)
+
+    def expand(self, node_id):
+        """
+        Finds neighbours of the vertex with given id among the vertices not expanded yet.
+
+        Must be called with the lock acquired.
+        """
+        self.expanded[node_id] = True
+        other_ids = np.flatnonzero(~self.expanded)
+        origin = self.coordinates[node_id]
+        if self.method == 'angular':
+            blocked = find_blocked_points(origin, self.coordinates[other_ids], get_obstacle_array(self.obstacles))
+        else:
+            blocked = get_obstacle_grid(self.obstacles).find_blocked_segments(origin, self.coordinates[other_ids])
+        if self.reduced:
+            blocked |= ~find_tangent_points(
+                self.nodes[node_id], [self.nodes[i] for i in other_ids.tolist()], get_tangent_signs(self.obstacles))
+        visible_ids = other_ids[~blocked].tolist()
+        distances = np.linalg.norm(self.coordinates[visible_ids] - origin, axis=1).tolist()
+        for distance, i in zip(distances, visible_ids):
+            self.found_adjacencies[i].append((distance, node_id))
+        self.adjacencies[node_id] = self.found_adjacencies[node_id] + list(zip(distances, visible_ids))
+        self.found_adjacencies[node_id] = None
+        self.expanded_count += 1
+        if self.expanded_count == len(self.nodes):
+            self.indexed_graph = create_indexed_graph_from_adjacencies(self.coordinates, self.adjacencies, self.nodes)
+            self.adjacencies = self.found_adjacencies = None
+
+    def warm_up(self, background=False):
+        """
+        Expands all vertices that have not been expanded yet.
+
+        If background is True, the vertices are expanded in a new daemon
+        thread, which is returned. Searches can run at the same time:
+        they wait only while one vertex is being expanded.
+        """
+        if background:
+            thread = threading.Thread(target=self.warm_up, daemon=True)
+            thread.start()
+            return thread
+        for node_id in range(len(self.nodes)):
+            with self.lock:
+                if self.indexed_graph is not None:
+                    break
+                if self.adjacencies[node_id] is None:
+                    self.expand(node_id)
+        return None
+
+    def find_components(self, adjacencies):
+        """
+        Returns a set of ids of components containing vertices from a list of (distance, id) tuples.
+
+        Until all vertices are expanded, all of them are treated as one component.
+        """
+        indexed_graph = self.indexed_graph
+        if indexed_graph is not None:
+            return indexed_graph.find_components(adjacencies)
+        return {0} if adjacencies else set()
+
+
+def create_indexed_graph_from_adjacencies(coordinates, adjacencies, nodes=None):
+    """
+    Creates an IndexedVisibilityGraph from a list of lists of (distance, id) tuples (one list per vertex).
+    """
+    offsets = np.zeros(len(coordinates) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(a) for a in adjacencies])
+    edges = [edge for vertex_adjacencies in adjacencies for edge in sorted(vertex_adjacencies, key=lambda a: a[1])]
+    distances = np.array([distance for distance, _ in edges], dtype=float)
+    neighbour_ids = np.array([i for _, i in edges], dtype=np.int32)
+    return IndexedVisibilityGraph(coordinates, offsets, neighbour_ids, distances, nodes)
+
+
+class SearchBuffers:
+    """
+    Stores per-node lists shared by consecutive searches in one graph.
+
+    Instead of being cleared before every search, the lists are marked
+    with the number of the search (generation) that wrote to them.
+    Values written by previous searches are ignored. The lists used
+    by the backward part of a bidirectional search are created only
+    if bidirectional is True.
+    """
+    def __init__(self, size, bidirectional=False):
+        self.distance_from_start = [0.0] * size
+        self.came_from = [0] * size
+        self.reached = [0] * size
+        self.visited = [0] * size
+        if bidirectional:
+            self.distance_to_destination = [0.0] * size
+            self.goes_to = [0] * size
+            self.reached_backward = [0] * size
+            self.visited_backward = [0] * size
+        self.generation = 0
+
+    def start_search(self):
+        """
+        Starts a new generation and returns its number.
+        """
+        self.generation += 1
+        return self.generation
+
+
+class PathSearch:
+    """
+    Represents a search for the path between start and destination that can be done in parts.
+
+    Each call to run continues the search (A* algorithm in the indexed
+    visibility graph, like find_path) until the path is found or the
+    given number of nodes is expanded or the given time passes. The
+    state of the search is kept between the calls. When the search
+    is stopped early, run returns a partial path: the path to the
+    reached node that is the closest to destination. Once the search
+    is finished, run returns the same result as find_path.
+    """
+    def __init__(self, start, destination, obstacles, method='pairwise', reduced=False):
+        self.start = start
+        self.destination = destination
+        self.graph = get_cached_indexed_visibility_graph(obstacles, method, reduced)
+        self.start_id = len(self.graph.nodes)
+        self.destination_id = self.start_id + 1
+        self.distance_from_start = {self.start_id: 0.0}
+        self.came_from = {}
+        self.visited = set()
+        self.nodes_to_visit = [(distance_estimate(start, destination), self.start_id)]
+        self.closest_id = self.start_id
+        self.closest_distance = distance_estimate(start, destination)
+        self.finished = start == destination
+        self.path = [] if self.finished else None
+
+        grid = get_obstacle_grid(obstacles)
+        if self.finished or grid.find_points_inside_obstacles([start, destination]).any():
+            self.finished = True
+            self.start_adjacencies, self.destination_adjacencies = [], {}
+            return
+        start_adjacencies, destination_adjacencies = find_endpoint_adjacencies(
+            [start, destination], obstacles, self.graph, reduced)
+        if not grid.find_blocked_segments(start, [destination])[0]:
+            start_adjacencies.append((distance_estimate(start, destination), self.destination_id))
+        elif self.graph.find_components(start_adjacencies).isdisjoint(
+                self.graph.find_components(destination_adjacencies)):
+            self.finished = True
+        self.start_adjacencies = start_adjacencies
+        self.destination_adjacencies = {i: d for d, i in destination_adjacencies}
+
+    def run(self, max_expansions=None, time_limit=None):
+        """
+        Continues the search and returns the path (complete or partial).
+
+        The search stops after expanding max_expansions nodes or after
+        time_limit seconds (if given). The finished attribute tells if
+        the returned path is complete (None means that there is no path).
+        """
+        if self.finished:
+            return None if self.path is None else list(self.path)
+        deadline = None if time_limit is None else time.perf_counter() + time_limit
+        expansions = edges_relaxed = 0
+        while self.nodes_to_visit:
+            if max_expansions is not None and expansions >= max_expansions:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            _, current_id = heapq.heappop(self.nodes_to_visit)
+            if current_id in self.visited:
+                continue
+            if current_id == self.destination_id:
+                self.finished = True
+                count_search_statistics(expansions, edges_relaxed)
+                self.path = self.reconstruct_path(current_id)
+                return list(self.path)
+            self.visited.add(current_id)
+            expansions += 1
+            edges_relaxed += self.expand(current_id)
+        else:
+            self.finished = True
+            count_search_statistics(expansions, edges_relaxed)
+            return None
+        count_search_statistics(expansions, edges_relaxed)
+        return self.reconstruct_path(self.closest_id)
+
+    def expand(self, current_id):
+        """
+        Updates the distances to the neighbours of the node with given id.
+
+        Returns the number of neighbours whose distance was updated.
+        """
+        edges_relaxed = 0
+        if current_id == self.start_id:
+            current_adjacencies = self.start_adjacencies
+        else:
+            current_adjacencies = self.graph.get_adjacencies(current_id)
+            if current_id in self.destination_adjacencies:
+                current_adjacencies.append((self.destination_adjacencies[current_id], self.destination_id))
+
+        for distance, neighbour_id in current_adjacencies:
+            if neighbour_id in self.visited:
+                continue
+            neighbour_distance = self.distance_from_start[current_id] + distance
+            if neighbour_distance < self.distance_from_start.get(neighbour_id, float('inf')):
+                edges_relaxed += 1
+                self.came_from[neighbour_id] = current_id
+                self.distance_from_start[neighbour_id] = neighbour_distance
+                remaining_distance = distance_estimate(self.get_node(neighbour_id), self.destination)
+                heapq.heappush(self.nodes_to_visit, (neighbour_distance + remaining_distance, neighbour_id))
+                if remaining_distance < self.closest_distance:
+                    self.closest_id = neighbour_id
+                    self.closest_distance = remaining_distance
+        return edges_relaxed
+
+    def get_node(self, node_id):
+        """
+        Returns the point with given id.
+        """
+        if node_id < self.start_id:
+            return self.graph.nodes[node_id]
+        return self.start if node_id == self.start_id else self.destination
+
+    def reconstruct_path(self, node_id):
+        """
+        Creates a path from start to the node with given id.
+        """
+        path = []
+        while node_id != self.start_id:
+            path.append(self.get_node(node_id))
+            node_id = self.came_from[node_id]
+        path.reverse()
+        return path
+
+
+class ShortestPathTable:
+    """
+    Stores lengths of shortest paths between all pairs of vertices of an IndexedVisibilityGraph.
+
+    The lengths are calculated with Floyd-Warshall algorithm. Along
+    with the distances matrix, the table contains a matrix of next
+    hops: next_hops[i, j] is the id of the vertex following the
+    vertex i on the shortest path from i to j (or -1 if there is
+    no such path). Since obstacles do not change, the table needs
+    to be calculated only once and then a path between any two
+    points can be found without searching the graph.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        size = len(graph.nodes)
+        self.distances = np.full((size, size), np.inf)
+        self.next_hops = np.full((size, size), -1, dtype=np.int32)
+        rows = np.repeat(np.arange(size), np.diff(graph.offsets))
+        self.distances[rows, graph.neighbour_ids] = graph.distances
+        self.next_hops[rows, graph.neighbour_ids] = graph.neighbour_ids
+        self.distances[np.arange(size), np.arange(size)] = 0
+        self.next_hops[np.arange(size), np.arange(size)] = np.arange(size)
+
+        for k in range(size):
+            via_k = self.distances[:, k, np.newaxis] + self.distances[k]
+            shorter = via_k < self.distances
+            np.copyto(self.distances, via_k, where=shorter)
+            np.copyto(self.next_hops, self.next_hops[:, k, np.newaxis], where=shorter)
+
+    def find_path(self, start, destination, start_adjacencies, destination_adjacencies, direct_distance=None):
+        """
+        Finds the shortest path from start to destination.
+
+        The adjacencies of start and destination are lists of (distance, id)
+        tuples (see find_endpoint_adjacencies). If destination is visible
+        from start, direct_distance is the distance between them. The path
+        goes through the pair of vertices (one adjacent to start and one
+        adjacent to destination) that minimizes total distance.
         """
-        Checks if the Agent is moving (if he has a path to follow).
+        if start == destination:
+            return []
+        best_distance = np.inf if direct_distance is None else direct_distance
+        path = [destination] if direct_distance is not None else None
+        if not start_adjacencies or not destination_adjacencies:
+            return path
+
+        start_distances, start_ids = np.array(start_adjacencies).T
+        destination_distances, destination_ids = np.array(destination_adjacencies).T
+        start_ids = start_ids.astype(int)
+        destination_ids = destination_ids.astype(int)
+        total_distances = (
+            start_distances[:, np.newaxis] + self.distances[np.ix_(start_ids, destination_ids)] +
+            destination_distances[np.newaxis, :])
+        i, j = np.unravel_index(np.argmin(total_distances), total_distances.shape)
+        if total_distances[i, j] >= best_distance:
+            return path
+
+        node_id, last_id = start_ids[i], destination_ids[j]
+        path = [self.graph.nodes[node_id]]
+        while node_id != last_id:
+            node_id = self.next_hops[node_id, last_id]
+            path.append(self.graph.nodes[node_id])
+        path.append(destination)
+        return path
+
+
+class VisibilityField:
+    """
+    Stores the vertices of an IndexedVisibilityGraph visible from cells of a grid.
+
+    The grid covers the obstacles with square cells of cell_size. By
+    default the cells are half as large as the cells of the obstacle grid
+    (see ObstacleGrid), so there are at most about four times as many
+    cells as obstacles. Visibility of all vertices is calculated for the
+    corners of the cells, and each cell stores two lists of vertices:
+
+    - Vertices visible from the whole cell. The segments from a vertex
+      to all points of a cell fill the convex hull of the vertex and the
+      cell. If the cell does not overlap any obstacle and the vertex is
+      visible from all four corners, an obstacle blocking the view from
+      some point of the cell would have to lie inside that hull, between
+      the segments to the corners. Only obstacles with a side shorter
+      than the diagonal of a cell fit there, so the vertex is visible
+      from the whole cell if none of them has its center inside the hull
+      (see find_hidden_vertices).
+    - Vertices that might be visible from a part of the cell. These are
+      all the other vertices, except those hidden from all four corners
+      by the same obstacle: the part of the plane hidden by an obstacle
+      is convex, so such a vertex is hidden from the whole cell.
+
+    Visibility of a point in a cell is then found by testing only the
+    segments to the vertices from the second list, so the result is the
+    same as testing all vertices. Points outside of the grid are tested
+    exactly (see find_endpoint_adjacencies). Only those tests use
+    reduced: cells store all visible vertices, even if not tangent.
+    """
+    def __init__(self, obstacles, graph, cell_size=None, reduced=False):
+        self.obstacles = obstacles
+        self.graph = graph
+        self.reduced = reduced
+        up, down, left, right = get_obstacle_array(obstacles).T
+        if not len(obstacles):
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self.shape = (0, 0)
+            self.cell_offsets = np.zeros(1, dtype=np.int64)
+            self.cell_vertex_ids = np.zeros(0, dtype=np.int32)
+            self.partial_offsets = np.zeros(1, dtype=np.int64)
+            self.partial_vertex_ids = np.zeros(0, dtype=np.int32)
+            return
+        if cell_size is None:
+            cell_size = get_obstacle_grid(obstacles).cell_size / 2
+        if not cell_size > 0:
+            raise ValueError('Cell size must be positive')
+
+        self.origin = np.array([left.min(), up.min()])
+        self.cell_size = float(cell_size)
+        extent = np.array([right.max(), down.max()]) - self.origin
+        self.shape = tuple(np.maximum(np.ceil(extent / self.cell_size).astype(int), 1).tolist())
+        columns, rows = self.shape
+
+        overlapping = np.zeros(self.shape, dtype=bool)
+        first_x, last_x = self.find_overlapping_cells(left, right, 0)
+        first_y, last_y = self.find_overlapping_cells(up, down, 1)
+        for i in range(len(obstacles)):
+            overlapping[first_x[i]:last_x[i] + 1, first_y[i]:last_y[i] + 1] = True
+
+        # Obstacles that could fit inside the hull of a vertex and a cell,
+        # with squares around their centers reaching as far as the hull does
+        # from the segment between the vertex and the center of the cell.
+        thin = np.minimum(right - left, down - up) < self.cell_size * math.sqrt(2)
+        self.thin_centers = np.stack([(left + right) / 2, (up + down) / 2], axis=1)[thin]
+        reach = self.cell_size * math.sqrt(2) / 2 * (1 + 1e-6)
+        self.thin_obstacle_grid = ObstacleGrid(tuple(
+            Obstacle(y - reach, y + reach, x - reach, x + reach) for x, y in self.thin_centers.tolist()))
+
+        # Visibility of the corners is found from each vertex with the
+        # angular culling (see find_blocking_obstacles), which is faster
+        # than testing segments using the obstacle grid. The blocking
+        # obstacle closest to the vertex usually hides a whole cell.
+        obstacle_array = get_obstacle_array(obstacles)
+        corners = self.origin + self.cell_size * np.stack(np.meshgrid(
+            np.arange(columns + 1), np.arange(rows + 1), indexing='ij'), axis=-1).reshape(-1, 2)
+        cell_x, cell_y = np.divmod(np.arange(columns * rows), rows)
+        cell_corners = [(cell_x + dx) * (rows + 1) + cell_y + dy for dx, dy in [(0, 0), (0, 1), (1, 0), (1, 1)]]
+        open_cells = ~overlapping.ravel()
+        visible_cells, partial_cells = [], []
+        for coordinates in graph.coordinates:
+            blockers = find_blocking_obstacles(coordinates, corners, obstacle_array)
+            corner_blockers = [blockers[ids] for ids in cell_corners]
+            visible = np.logical_and.reduce([b < 0 for b in corner_blockers]) & open_cells
+            blocked = np.logical_and.reduce([b >= 0 for b in corner_blockers])
+            hidden = blocked & np.logical_and.reduce([b == corner_blockers[0] for b in corner_blockers[1:]])
+            # Corners blocked by different obstacles might still all be
+            # blocked by one of them.
+            mixed = np.flatnonzero(blocked & ~hidden)
+            for candidates in corner_blockers:
+                hidden[mixed[np.logical_and.reduce([
+                    segments_cross_paired_obstacles(coordinates, corners[ids[mixed]], obstacle_array[candidates[mixed]])
+                    for ids in cell_corners])]] = True
+            visible_cells.append(np.flatnonzero(visible))
+            partial_cells.append(np.flatnonzero(~visible & ~hidden))
+
+        vertex_ids = np.arange(len(graph.nodes))
+        visible_vertex_ids = np.repeat(vertex_ids, [len(cells) for cells in visible_cells])
+        partial_vertex_ids = np.repeat(vertex_ids, [len(cells) for cells in partial_cells])
+        visible_cells = np.concatenate(visible_cells + [np.zeros(0, dtype=int)])
+        partial_cells = np.concatenate(partial_cells + [np.zeros(0, dtype=int)])
+        # Vertices hidden by thin obstacles from a part of a cell are moved to the second list.
+        hidden = self.find_hidden_vertices(visible_cells, visible_vertex_ids)
+        self.cell_offsets, self.cell_vertex_ids = self.create_cell_lists(
+            visible_cells[~hidden], visible_vertex_ids[~hidden], columns * rows)
+        self.partial_offsets, self.partial_vertex_ids = self.create_cell_lists(
+            np.concatenate([partial_cells, visible_cells[hidden]]),
+            np.concatenate([partial_vertex_ids, visible_vertex_ids[hidden]]), columns * rows)
+
+    @staticmethod
+    def create_cell_lists(cells, vertex_ids, cell_count):
         """
-        return bool(self.path)
+        Stores the vertex ids of (cell, vertex id) pairs for each cell in compressed sparse row format.
 
-    def calculate_new_path(self, destination, obstacles):
+        Returns the offsets and the ids. Ids in each cell keep their order.
         """
-        Calculates new path from Agent's current position to given destination and stores this path.
+        offsets = np.zeros(cell_count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(cells, minlength=cell_count))
+        return offsets, vertex_ids[np.argsort(cells, kind='stable')].astype(np.int32)
+
+    def find_hidden_vertices(self, cells, vertex_ids):
         """
-        obstacles = self.create_obstacles_in_configuration_space(obstacles)
-        self.path = find_path(self.position, destination, obstacles)
+        Checks which vertices might be hidden from a part of a cell, for (cell, vertex id) pairs.
 
-    @lru_cache(maxsize=8)
-    def create_obstacles_in_configuration_space(self, obstacles):
+        The vertices must be visible from all corners of the cells. Returns
+        a boolean array, True for the pairs for which the center of any thin
+        obstacle lies strictly inside the convex hull of the vertex and the
+        cell: the ray from the vertex through that center crosses the cell
+        behind the center.
         """
-        Creates new 'inflated' obstacles.
+        hidden = np.zeros(len(cells), dtype=bool)
+        if not len(self.thin_centers) or not len(cells):
+            return hidden
+        corners = self.origin + self.cell_size * np.stack(np.divmod(cells, self.shape[1]), axis=1)
+        centers = corners + self.cell_size / 2
+        vertices = self.graph.coordinates[vertex_ids]
+        block_length = max(1, MAX_BLOCK_SIZE // (4 * sum(self.thin_obstacle_grid.shape)))
+        for block_start in range(0, len(cells), block_length):
+            block = slice(block_start, block_start + block_length)
+            pairs, thin_ids = self.thin_obstacle_grid.find_candidates(vertices[block], centers[block])
+            pairs += block_start
+            directions = self.thin_centers[thin_ids] - vertices[pairs]
+            lengths = np.hypot(directions[:, 0], directions[:, 1])
+            valid = lengths > 0
+            pairs, thin_ids, directions, lengths = pairs[valid], thin_ids[valid], directions[valid], lengths[valid]
+            thin_centers = self.thin_centers[thin_ids]
+            reach = np.hypot(*(centers[pairs] - thin_centers).T) + 2 * self.cell_size
+            ray_ends = thin_centers + directions * (reach / lengths)[:, np.newaxis]
+            cell_obstacles = np.stack([
+                corners[pairs, 1], corners[pairs, 1] + self.cell_size,
+                corners[pairs, 0], corners[pairs, 0] + self.cell_size], axis=1)
+            hidden[pairs[segments_cross_paired_obstacles(thin_centers, ray_ends, cell_obstacles)]] = True
+        return hidden
 
-        Each obstacle is transformed by increasing its size by the size
-        of the Agent. That allows the Agent to be represented as a single
-        point instead of a rectangle.
+    def find_overlapping_cells(self, low, high, axis):
         """
-        obstacles_in_configuration_space = [
-            Obstacle(
-                obs.up - self.size_y, obs.down + self.size_y,
-                obs.left - self.size_x, obs.right + self.size_x)
-            for obs in obstacles]
-        return tuple(obstacles_in_configuration_space)
+        Returns indices of the first and the last cell whose interior overlaps (low, high) along given axis.
+        """
+        first = np.floor((low - self.origin[axis]) / self.cell_size).astype(int)
+        last = np.ceil((high - self.origin[axis]) / self.cell_size).astype(int) - 1
+        return np.clip(first, 0, self.shape[axis] - 1), np.clip(last, 0, self.shape[axis] - 1)
 
-    def move_along_path(self):
+    def find_cell(self, point):
         """
-        Moves the Agent and updates his path.
+        Returns the index of the cell containing given point (or None if the point lies outside of the grid).
+        """
+        x = math.floor((point[0] - self.origin[0]) / self.cell_size)
+        y = math.floor((point[1] - self.origin[1]) / self.cell_size)
+        if not (0 <= x < self.shape[0] and 0 <= y < self.shape[1]):
+            return None
+        return x * self.shape[1] + y
 
-        Takes the next point of current path. If that point is close enough
-        (within one velocity distance), moves the agent to that point and
-        removes the point from path. Otherwise moves the agent by one velocity
-        distance toward that point.
+    def find_endpoint_adjacencies(self, endpoints):
+        """
+        Finds vertices visible from given points (see find_endpoint_adjacencies).
 
-        If the path is empty, the method doesn't do anything.
+        The segments to the vertices that might be visible from a part of
+        a cell are tested together for all points, using the obstacle grid.
         """
-        if not self.path:
-            return
-        next_point = self.path[0]
-        next_point_delta = np.subtract(next_point, self.position)
-        distance_to_next_point = np.linalg.norm(next_point_delta)
+        cell_ids = [None] * len(endpoints)
+        exact_indices = []
+        tested_indices, tested_ids = [], []
+        for i, point in enumerate(endpoints):
+            cell = self.find_cell(point)
+            if cell is None:
+                exact_indices.append(i)
+                continue
+            cell_ids[i] = self.cell_vertex_ids[self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+            partial_ids = self.partial_vertex_ids[self.partial_offsets[cell]:self.partial_offsets[cell + 1]]
+            tested_indices.append(np.full(len(partial_ids), i))
+            tested_ids.append(partial_ids)
+        count_statistics('visibility_field_hits', len(endpoints) - len(exact_indices))
 
-        if distance_to_next_point < self.velocity:
-            self.position = self.path.pop(0)
-        else:
-            velocity_vector = np.multiply(next_point_delta, self.velocity / distance_to_next_point)
-            new_position = np.add(self.position, velocity_vector)
-            self.position = Point(*new_position)
+        endpoint_adjacencies = [None] * len(endpoints)
+        if tested_ids:
+            points = np.array(endpoints, dtype=float).reshape(-1, 2)
+            tested_indices = np.concatenate(tested_indices)
+            tested_ids = np.concatenate(tested_ids)
+            blocked = get_obstacle_grid(self.obstacles).find_blocked_segments(
+                points[tested_indices], self.graph.coordinates[tested_ids])
+            visible_ids = tested_ids[~blocked]
+            bounds = np.searchsorted(tested_indices[~blocked], np.arange(len(endpoints) + 1))
+            for i, point in enumerate(endpoints):
+                if cell_ids[i] is None:
+                    continue
+                ids = np.concatenate([cell_ids[i], visible_ids[bounds[i]:bounds[i + 1]]])
+                coordinates = self.graph.coordinates[ids]
+                distances = np.hypot(coordinates[:, 0] - point[0], coordinates[:, 1] - point[1])
+                endpoint_adjacencies[i] = list(zip(distances.tolist(), ids.tolist()))
+        exact_adjacencies = find_endpoint_adjacencies(
+            [endpoints[i] for i in exact_indices], self.obstacles, self.graph, self.reduced)
+        for i, adjacencies in zip(exact_indices, exact_adjacencies):
+            endpoint_adjacencies[i] = adjacencies
+        return endpoint_adjacencies
 
 
-def find_path(start, destination, obstacles):
+def find_path(start, destination, obstacles, method='pairwise', reduced=False, bidirectional=False,
+              use_visibility_field=False, lazy=False):
     """
     Calculates the path between start and destination, avoiding the obstacles.
 
@@ -90,17 +1592,165 @@ def find_path(start, destination, obstacles):
     The path does not contain the starting point, since that point
     is already visited. The path contains the destination as its
     last element.
+
+    The method and reduced arguments select how the visibility graph
+    for obstacles is built (see create_visibility_graph_for_obstacles).
+    The search runs on the indexed graph (see IndexedVisibilityGraph),
+    which is created only once for given obstacles. If bidirectional
+    is True, the graph is searched from both ends at once (see
+    find_path_using_indexed_graph_bidirectional). If use_visibility_field
+    is True, vertices visible from start and destination are looked up
+    in a VisibilityField, created once for given obstacles. If lazy
+    is True, a LazyVisibilityGraph is searched instead, so the first
+    path is found without creating the whole graph.
     """
-    visibility_graph = create_visibility_graph(start, destination, obstacles)
-    path = find_path_using_visibility_graph(start, destination, visibility_graph)
-    return path
+    return find_paths([(start, destination)], obstacles, method, reduced, bidirectional, use_visibility_field,
+                      lazy)[0]
+
+
+def find_paths(pairs, obstacles, method='pairwise', reduced=False, bidirectional=False, use_visibility_field=False,
+               lazy=False):
+    """
+    Calculates paths for many (start, destination) pairs, avoiding the same obstacles.
+
+    Returns a list of paths (see find_path), in the order of given pairs.
+    The visibility graph for obstacles is created (or taken from cache)
+    only once.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    if lazy:
+        graph = get_lazy_visibility_graph(obstacles, method, reduced)
+    else:
+        graph = get_cached_indexed_visibility_graph(obstacles, method, reduced)
+    visibility_field = get_visibility_field(obstacles, method, reduced) if use_visibility_field else None
+    return find_paths_using_indexed_graph(pairs, obstacles, graph, reduced, bidirectional, visibility_field)
+
+
+def find_paths_using_indexed_graph(pairs, obstacles, graph, reduced=False, bidirectional=False,
+                                   visibility_field=None):
+    """
+    Calculates paths for many (start, destination) pairs using indexed visibility graph for obstacles.
+
+    Visibility of all starts and destinations is calculated together
+    and the searches reuse the same buffers.
+
+    Points inside obstacles are found using the obstacle grid and their
+    visibility is not calculated. Paths from or to such points, as well
+    as paths between points that see only vertices from different
+    connected components of the graph, are not searched for at all.
+    If visibility_field is given, it is used to find vertices visible
+    from starts and destinations (see VisibilityField).
+    """
+    if not pairs:
+        return []
+    with measure_stage('endpoint_visibility'):
+        grid = get_obstacle_grid(obstacles)
+        endpoints = list(dict.fromkeys(point for pair in pairs for point in pair))
+        inside = grid.find_points_inside_obstacles(endpoints)
+        reachable_endpoints = [point for point, is_inside in zip(endpoints, inside) if not is_inside]
+        if visibility_field is None:
+            adjacencies = find_endpoint_adjacencies(reachable_endpoints, obstacles, graph, reduced)
+        else:
+            adjacencies = visibility_field.find_endpoint_adjacencies(reachable_endpoints)
+        endpoint_adjacencies = dict(zip(reachable_endpoints, adjacencies))
+        endpoint_components = {point: graph.find_components(a) for point, a in endpoint_adjacencies.items()}
+        pairs_visible = ~grid.find_blocked_segments(
+            [start for start, _ in pairs], [destination for _, destination in pairs])
+
+    with measure_stage('search'):
+        buffers = SearchBuffers(len(graph.nodes) + 2, bidirectional)
+        search = find_path_using_indexed_graph_bidirectional if bidirectional else find_path_using_indexed_graph
+        destination_adjacencies = {}
+        paths = []
+        for (start, destination), visible in zip(pairs, pairs_visible):
+            if start == destination:
+                paths.append([])
+                continue
+            if start not in endpoint_adjacencies or destination not in endpoint_adjacencies:
+                paths.append(None)
+                continue
+            if not visible and endpoint_components[start].isdisjoint(endpoint_components[destination]):
+                paths.append(None)
+                continue
+            if destination not in destination_adjacencies:
+                destination_adjacencies[destination] = {i: d for d, i in endpoint_adjacencies[destination]}
+            start_adjacencies = endpoint_adjacencies[start]
+            if visible:
+                start_adjacencies = start_adjacencies + [
+                    (math.hypot(start.x - destination.x, start.y - destination.y), len(graph.nodes) + 1)]
+            paths.append(search(
+                start, destination, graph, start_adjacencies, destination_adjacencies[destination], buffers))
+    return paths
+
+
+def find_path_using_shortest_path_table(start, destination, obstacles, method='pairwise', reduced=False):
+    """
+    Calculates the path between start and destination using precalculated shortest paths.
+
+    Returns the same path as find_path (see ShortestPathTable). The table
+    is calculated once for given obstacles, which might take a long time
+    for large maps, but afterwards no search is performed.
+    """
+    table = get_shortest_path_table(obstacles, method, reduced)
+    start_adjacencies, destination_adjacencies = find_endpoint_adjacencies(
+        [start, destination], obstacles, table.graph, reduced)
+    direct_distance = None
+    if not get_obstacle_grid(obstacles).find_blocked_segments(start, [destination])[0]:
+        direct_distance = math.hypot(start.x - destination.x, start.y - destination.y)
+    return table.find_path(start, destination, start_adjacencies, destination_adjacencies, direct_distance)
+
+
+def find_endpoint_adjacencies(endpoints, obstacles, graph, reduced=False):
+    """
+    Finds vertices of indexed visibility graph visible from given points.
+
+    Returns a list with one entry per point: a list of (distance, id)
+    tuples. All points are tested together, in blocks limited by MAX_BLOCK_SIZE.
+    """
+    vertex_count = len(graph.nodes)
+    if not vertex_count:
+        return [[] for _ in endpoints]
+
+    endpoint_adjacencies = []
+    block_length = max(1, MAX_BLOCK_SIZE // vertex_count)
+    for block_start in range(0, len(endpoints), block_length):
+        block = np.array(endpoints[block_start:block_start + block_length], dtype=float).reshape(-1, 2)
+        visible = find_visible_vertices(block, obstacles, graph, reduced)
+        distances = np.linalg.norm(graph.coordinates[np.newaxis, :, :] - block[:, np.newaxis, :], axis=2)
+        for row_visible, row_distances in zip(visible, distances):
+            ids = np.flatnonzero(row_visible)
+            endpoint_adjacencies.append(list(zip(row_distances[ids].tolist(), ids.tolist())))
+    return endpoint_adjacencies
+
+
+def find_visible_vertices(points, obstacles, graph, reduced=False):
+    """
+    Checks which vertices of indexed visibility graph are visible from given points.
+
+    The points are an array of shape (M, 2). Returns a boolean array
+    of shape (M, number of vertices). If reduced is True, vertices
+    which are not tangent to obstacles when seen from a point are
+    treated as not visible from it (see get_tangent_signs).
+    """
+    vertex_count = len(graph.nodes)
+    visible = ~get_obstacle_grid(obstacles).find_blocked_segments(
+        np.repeat(points, vertex_count, axis=0), np.tile(graph.coordinates, (len(points), 1)))
+    visible = visible.reshape(len(points), vertex_count)
+    if reduced:
+        tangent_signs = get_tangent_signs(obstacles)
+        signs = np.array([tangent_signs.get(node, 0) for node in graph.nodes])
+        deltas = graph.coordinates[np.newaxis, :, :] - points[:, np.newaxis, :]
+        visible &= deltas[:, :, 0] * deltas[:, :, 1] * signs <= 0
+    return visible
 
 
-def create_visibility_graph(start, destination, obstacles):
+def create_visibility_graph(start, destination, obstacles, method='pairwise', reduced=False):
     """
     Creates a visibility graph.
 
-    The graph is a dictionary. The key set contains all the vertices
+    The graph is a mapping. The key set contains all the vertices
     (corners) of all the obstacles as well as start and destination
     points. The value for each key is a list of adjacent points and
     distances to those points. Each entry on the list is in a form
@@ -111,48 +1761,266 @@ def create_visibility_graph(start, destination, obstacles):
     then the list of adjacent points for p2 will contain p1. The
     list of adjacent points might be empty, if the point has no
     adjacent ones.
+
+    The graph for obstacles is cached, so it is not modified. Instead,
+    start and destination are added to an overlay, which is discarded
+    together with the returned graph.
     """
-    visibility_graph = create_visibility_graph_for_obstacles(obstacles)
-    add_vertex_to_visibility_graph(start, obstacles, visibility_graph)
-    add_vertex_to_visibility_graph(destination, obstacles, visibility_graph)
+    visibility_graph = VisibilityGraphOverlay(create_visibility_graph_for_obstacles(obstacles, method, reduced))
+    add_vertex_to_visibility_graph(start, obstacles, visibility_graph, reduced)
+    add_vertex_to_visibility_graph(destination, obstacles, visibility_graph, reduced)
     return visibility_graph
 
 
 def find_path_using_visibility_graph(start, destination, visibility_graph):
     """
     Finds path from start to destination using visibility graph and A* algorithm.
-    """
-    nodes_to_visit = set()
-    nodes_to_visit.add(start)
-    visited_nodes = set()
-    came_from_graph = {}
 
-    distance_from_start = defaultdict(lambda: float('inf'))
-    distance_from_start[start] = 0
-    estimated_distance = defaultdict(lambda: float('inf'))
-    estimated_distance[start] = distance_estimate(start, destination)
+    Nodes are given integer ids in the order in which they are discovered.
+    Nodes to visit are kept in a binary heap. Instead of being updated,
+    outdated heap entries are skipped when they are popped.
+    """
+    node_ids = {start: 0}
+    nodes = [start]
+    distance_from_start = [0]
+    came_from = [None]
+    visited = [False]
+    nodes_to_visit = [(distance_estimate(start, destination), 0)]
 
     while nodes_to_visit:
-        min_estimated_distance = min(estimated_distance[n] for n in nodes_to_visit)
-        current_node = next(node for node in nodes_to_visit if estimated_distance[node] == min_estimated_distance)
+        _, current_id = heapq.heappop(nodes_to_visit)
+        if visited[current_id]:
+            continue
+        current_node = nodes[current_id]
         if current_node == destination:
-            return reconstruct_path_to_point(destination, came_from_graph)
-        nodes_to_visit.remove(current_node)
-        visited_nodes.add(current_node)
+            return reconstruct_path_from_ids(current_id, came_from, nodes)
+        visited[current_id] = True
         for adjacency in visibility_graph[current_node]:
             neighbour_node = adjacency.point
-            if neighbour_node in visited_nodes:
+            neighbour_id = node_ids.get(neighbour_node)
+            if neighbour_id is None:
+                neighbour_id = len(nodes)
+                node_ids[neighbour_node] = neighbour_id
+                nodes.append(neighbour_node)
+                distance_from_start.append(float('inf'))
+                came_from.append(None)
+                visited.append(False)
+            elif visited[neighbour_id]:
+                continue
+            neighbour_distance = distance_from_start[current_id] + adjacency.distance
+            if neighbour_distance < distance_from_start[neighbour_id]:
+                came_from[neighbour_id] = current_id
+                distance_from_start[neighbour_id] = neighbour_distance
+                estimated_distance = neighbour_distance + distance_estimate(neighbour_node, destination)
+                heapq.heappush(nodes_to_visit, (estimated_distance, neighbour_id))
+    return None
+
+
+def find_path_using_indexed_graph(start, destination, graph, start_adjacencies, destination_adjacencies, buffers):
+    """
+    Finds path from start to destination using indexed visibility graph and A* algorithm.
+
+    The graph is not modified: start and destination get the ids
+    following the ids of graph vertices. Adjacencies of start are
+    given as a list of (distance, id) tuples and adjacencies of
+    destination as a dictionary mapping ids to distances. The
+    search uses (and overwrites) given SearchBuffers.
+    """
+    if start == destination:
+        return []
+    start_id = len(graph.nodes)
+    destination_id = start_id + 1
+    nodes = graph.nodes
+    distance_from_start = buffers.distance_from_start
+    came_from = buffers.came_from
+    reached = buffers.reached
+    visited = buffers.visited
+    generation = buffers.start_search()
+
+    distance_from_start[start_id] = 0.0
+    reached[start_id] = generation
+    nodes_to_visit = [(distance_estimate(start, destination), start_id)]
+    nodes_expanded = edges_relaxed = 0
+
+    while nodes_to_visit:
+        _, current_id = heapq.heappop(nodes_to_visit)
+        if visited[current_id] == generation:
+            continue
+        if current_id == destination_id:
+            count_search_statistics(nodes_expanded, edges_relaxed)
+            path = [destination]
+            current_id = came_from[destination_id]
+            while current_id != start_id:
+                path.append(nodes[current_id])
+                current_id = came_from[current_id]
+            path.reverse()
+            return path
+        visited[current_id] = generation
+        nodes_expanded += 1
+
+        if current_id == start_id:
+            current_adjacencies = start_adjacencies
+        else:
+            current_adjacencies = graph.get_adjacencies(current_id)
+            if current_id in destination_adjacencies:
+                current_adjacencies.append((destination_adjacencies[current_id], destination_id))
+
+        for distance, neighbour_id in current_adjacencies:
+            if visited[neighbour_id] == generation:
                 continue
-            neighbour_distance = distance_from_start[current_node] + adjacency.distance
-            if neighbour_node not in nodes_to_visit or neighbour_distance < distance_from_start[neighbour_node]:
-                came_from_graph[neighbour_node] = current_node
-                distance_from_start[neighbour_node] = neighbour_distance
-                estimated_distance[neighbour_node] = neighbour_distance + distance_estimate(neighbour_node, destination)
-                if neighbour_node not in nodes_to_visit:
-                    nodes_to_visit.add(neighbour_node)
+            neighbour_distance = distance_from_start[current_id] + distance
+            if reached[neighbour_id] != generation or neighbour_distance < distance_from_start[neighbour_id]:
+                edges_relaxed += 1
+                reached[neighbour_id] = generation
+                came_from[neighbour_id] = current_id
+                distance_from_start[neighbour_id] = neighbour_distance
+                if neighbour_id == destination_id:
+                    estimated_distance = neighbour_distance
+                else:
+                    neighbour = nodes[neighbour_id]
+                    estimated_distance = neighbour_distance + math.hypot(
+                        neighbour.x - destination.x, neighbour.y - destination.y)
+                heapq.heappush(nodes_to_visit, (estimated_distance, neighbour_id))
+    count_search_statistics(nodes_expanded, edges_relaxed)
     return None
 
 
+def find_path_using_indexed_graph_bidirectional(
+        start, destination, graph, start_adjacencies, destination_adjacencies, buffers):
+    """
+    Finds path from start to destination like find_path_using_indexed_graph, searching from both ends at once.
+
+    The graph is undirected, so one A* search runs forward from start
+    (estimating the distance to destination) and another backward from
+    destination (estimating the distance to start). The search with
+    fewer nodes to visit is advanced first. The length of the best path
+    through a node reached by both searches is remembered. Since the
+    estimates never exceed real distances, no shorter path exists once
+    the estimated length of every path left in either search is at
+    least that long, so the search stops then. Nodes already visited
+    by the other search are not expanded and nodes whose estimated path
+    is not shorter than the best one are not added. The path has the
+    same length as the one found by find_path_using_indexed_graph.
+    The buffers must be created with bidirectional=True.
+    """
+    if start == destination:
+        return []
+    start_id = len(graph.nodes)
+    destination_id = start_id + 1
+    nodes = graph.nodes
+    generation = buffers.start_search()
+    start_distances = {i: d for d, i in start_adjacencies}
+    destination_list = [(d, i) for i, d in destination_adjacencies.items()]
+    if destination_id in start_distances:
+        destination_list.append((start_distances[destination_id], start_id))
+
+    # Lists of the forward (first) and backward (second) search.
+    distances = (buffers.distance_from_start, buffers.distance_to_destination)
+    previous_ids = (buffers.came_from, buffers.goes_to)
+    reached = (buffers.reached, buffers.reached_backward)
+    visited = (buffers.visited, buffers.visited_backward)
+    targets = (destination, start)
+    direct_distance = distance_estimate(start, destination)
+    nodes_to_visit = ([(direct_distance, start_id)], [(direct_distance, destination_id)])
+    for direction, endpoint_id in enumerate((start_id, destination_id)):
+        distances[direction][endpoint_id] = 0.0
+        reached[direction][endpoint_id] = generation
+    best_distance = float('inf')
+    meeting_id = None
+    nodes_expanded = edges_relaxed = 0
+
+    while True:
+        for direction in range(2):
+            while nodes_to_visit[direction] and visited[direction][nodes_to_visit[direction][0][1]] == generation:
+                heapq.heappop(nodes_to_visit[direction])
+        if not nodes_to_visit[0] or not nodes_to_visit[1]:
+            break
+        if nodes_to_visit[0][0][0] >= best_distance or nodes_to_visit[1][0][0] >= best_distance:
+            break
+        direction = 0 if len(nodes_to_visit[0]) <= len(nodes_to_visit[1]) else 1
+        _, current_id = heapq.heappop(nodes_to_visit[direction])
+        visited[direction][current_id] = generation
+        if visited[1 - direction][current_id] == generation:
+            continue
+        nodes_expanded += 1
+
+        if current_id == start_id:
+            current_adjacencies = start_adjacencies
+        elif current_id == destination_id:
+            current_adjacencies = destination_list
+        else:
+            current_adjacencies = graph.get_adjacencies(current_id)
+            if current_id in destination_adjacencies:
+                current_adjacencies.append((destination_adjacencies[current_id], destination_id))
+            if current_id in start_distances:
+                current_adjacencies.append((start_distances[current_id], start_id))
+
+        target = targets[direction]
+        current_distances = distances[direction]
+        other_distances = distances[1 - direction]
+        for distance, neighbour_id in current_adjacencies:
+            if visited[direction][neighbour_id] == generation:
+                continue
+            neighbour_distance = current_distances[current_id] + distance
+            if reached[direction][neighbour_id] != generation or neighbour_distance < current_distances[neighbour_id]:
+                edges_relaxed += 1
+                reached[direction][neighbour_id] = generation
+                previous_ids[direction][neighbour_id] = current_id
+                current_distances[neighbour_id] = neighbour_distance
+                if reached[1 - direction][neighbour_id] == generation and \
+                        neighbour_distance + other_distances[neighbour_id] < best_distance:
+                    best_distance = neighbour_distance + other_distances[neighbour_id]
+                    meeting_id = neighbour_id
+                if neighbour_id == start_id:
+                    neighbour = start
+                elif neighbour_id == destination_id:
+                    neighbour = destination
+                else:
+                    neighbour = nodes[neighbour_id]
+                estimated_distance = neighbour_distance + math.hypot(neighbour.x - target.x, neighbour.y - target.y)
+                if estimated_distance < best_distance:
+                    heapq.heappush(nodes_to_visit[direction], (estimated_distance, neighbour_id))
+    count_search_statistics(nodes_expanded, edges_relaxed)
+    if meeting_id is None:
+        return None
+
+    path_ids = []
+    node_id = meeting_id
+    while node_id != start_id:
+        path_ids.append(node_id)
+        node_id = buffers.came_from[node_id]
+    path_ids.reverse()
+    node_id = meeting_id
+    while node_id != destination_id:
+        node_id = buffers.goes_to[node_id]
+        path_ids.append(node_id)
+    return [destination if node_id == destination_id else nodes[node_id] for node_id in path_ids]
+
+
+def count_search_statistics(nodes_expanded, edges_relaxed):
+    """
+    Adds the numbers of nodes expanded and edges relaxed by a search to the statistics (if collected).
+    """
+    if active_statistics is not None:
+        active_statistics.count('nodes_expanded', nodes_expanded)
+        active_statistics.count('edges_relaxed', edges_relaxed)
+
+
+def reconstruct_path_from_ids(node_id, came_from, nodes):
+    """
+    Creates a path from start to the node with given id.
+
+    Works like reconstruct_path_to_point, but uses the list of preceding
+    node ids and the list of nodes (indexed by their ids) instead of a dictionary.
+    """
+    path = []
+    while came_from[node_id] is not None:
+        path.append(nodes[node_id])
+        node_id = came_from[node_id]
+    path.reverse()
+    return path
+
+
 def reconstruct_path_to_point(point, came_from_graph):
     """
     Creates a path from start to destination.
@@ -162,17 +2030,71 @@ def reconstruct_path_to_point(point, came_from_graph):
     """
     path = []
     while point in came_from_graph:
-        path.insert(0, point)
+        path.append(point)
         point = came_from_graph[point]
+    path.reverse()
     return path
 
 
-@lru_cache(maxsize=128)
+def shortcut_path(start, path, obstacles):
+    """
+    Removes the points of path that can be skipped, going straight to a farther point instead.
+
+    From each kept point (beginning with start), the path goes to the
+    farthest of the following points visible from it. The visibility of
+    all of them is checked at once (see ObstacleGrid.find_blocked_segments).
+    Paths found in a visibility graph cannot be shortened this way, but
+    paths built from approximate pieces (e.g. reused by PathCache with
+    snap_size or found by HierarchicalPlanner) often can.
+    """
+    if path is None or len(path) < 2:
+        return path
+    grid = get_obstacle_grid(obstacles)
+    shortened_path = []
+    current_point = start
+    first_index = 0
+    while first_index < len(path) - 1:
+        blocked = grid.find_blocked_segments(current_point, path[first_index + 1:])
+        visible = np.flatnonzero(~blocked)
+        next_index = first_index + 1 + visible[-1] if len(visible) else first_index
+        current_point = path[next_index]
+        shortened_path.append(current_point)
+        first_index = next_index + 1
+    if first_index == len(path) - 1:
+        shortened_path.append(path[-1])
+    return shortened_path
+
+
 def distance_estimate(point, goal):
     """
     Returns Euclidean distance between given points.
     """
-    return np.linalg.norm(np.subtract(point, goal))
+    return math.hypot(point[0] - goal[0], point[1] - goal[1])
+
+
+def grow_array(array, length):
+    """
+    Returns a copy of array extended with zeros to given length.
+    """
+    grown_array = np.zeros((length, ) + array.shape[1:], dtype=array.dtype)
+    grown_array[:len(array)] = array
+    return grown_array
+
+
+def inflate_obstacles(obstacles, size_x, size_y):
+    """
+    Creates new 'inflated' obstacles.
+
+    Each obstacle is transformed by increasing its size by the size
+    of the Agent. That allows the Agent to be represented as a single
+    point instead of a rectangle.
+    """
+    obstacles_in_configuration_space = [
+        Obstacle(
+            obs.up - size_y, obs.down + size_y,
+            obs.left - size_x, obs.right + size_x)
+        for obs in obstacles]
+    return tuple(obstacles_in_configuration_space)
 
 
 @lru_cache(maxsize=8)
@@ -182,12 +2104,80 @@ def get_all_vertices(obstacles):
     """
     vertices = set()
     for obs in obstacles:
-        vertices.update([Point(x, y) for x, y in itertools.product([obs.left, obs.right], [obs.up, obs.down])])
+        vertices.update(get_obstacle_corners(obs))
+    return vertices
+
+
+def get_obstacle_corners(obstacle):
+    """
+    Returns a list of 4 vertices (corners) of given obstacle.
+    """
+    return [Point(x, y) for x, y in itertools.product([obstacle.left, obstacle.right], [obstacle.up, obstacle.down])]
+
+
+def get_graph_vertices(obstacles, reduced=False):
+    """
+    Returns a set of vertices of the visibility graph for given obstacles.
+
+    These are either all vertices of the obstacles or, for reduced graph,
+    only the ones that can be used by shortest paths.
+    """
+    vertices = get_all_vertices(obstacles)
+    if reduced:
+        tangent_signs = get_tangent_signs(obstacles)
+        vertices = {v for v in vertices if v in tangent_signs}
     return vertices
 
 
 @lru_cache(maxsize=8)
-def create_visibility_graph_for_obstacles(obstacles):
+def get_tangent_signs(obstacles):
+    """
+    Returns a dictionary of vertices usable by shortest paths and their tangent signs.
+
+    A shortest path can only turn in a vertex while going around
+    an obstacle that has a corner there. Both lines meeting in that
+    vertex are then tangent to the obstacle: they do not enter the
+    quadrant occupied by it. A line with direction (dx, dy) does
+    not enter the quadrant (sx, sy) if dx * dy * sx * sy is not positive,
+    so sx * sy is the tangent sign of that corner. If a vertex is
+    a corner of obstacles with different tangent signs, every line
+    is tangent to one of them and the sign is 0.
+
+    Vertices lying inside other obstacles cannot be reached and
+    are not included. Vertices lying on a side of another obstacle
+    are kept, since paths are allowed to go along obstacle sides.
+    """
+    up, down, left, right = get_obstacle_array(obstacles).T
+    tangent_signs = {}
+    for vertex in get_all_vertices(obstacles):
+        x, y = vertex
+        if np.any((left < x) & (x < right) & (up < y) & (y < down)):
+            continue
+        signs = {
+            (1 if (x == obs.left) == (y == obs.up) else -1)
+            for obs in obstacles if x in (obs.left, obs.right) and y in (obs.up, obs.down)}
+        tangent_signs[vertex] = signs.pop() if len(signs) == 1 else 0
+    return tangent_signs
+
+
+def find_tangent_points(point, other_points, corner_signs):
+    """
+    Checks which lines from point to other_points are tangent to obstacles at both ends.
+
+    Uses tangent signs of vertices (see get_tangent_signs). Points that
+    are not vertices (like start and destination) do not limit the lines.
+    Returns a boolean array.
+    """
+    if not other_points:
+        return np.zeros(0, dtype=bool)
+    deltas = np.subtract(other_points, point)
+    products = deltas[:, 0] * deltas[:, 1]
+    other_signs = np.array([corner_signs.get(p, 0) for p in other_points])
+    return (products * other_signs <= 0) & (products * corner_signs.get(point, 0) <= 0)
+
+
+@lru_cache(maxsize=8)
+def create_visibility_graph_for_obstacles(obstacles, method='pairwise', reduced=False):
     """
     Creates a visibility graph only for given obstacles (with no start and destination).
 
@@ -197,36 +2187,244 @@ def create_visibility_graph_for_obstacles(obstacles):
     there is no reason to calculate the visibility graph for
     obstacles more than once. However, the start and destination
     change very often, so visibility for them is calculated using another method.
+
+    The method can be either 'pairwise' (every pair of vertices is tested
+    against all obstacles) or 'angular' (see create_visibility_graph_using_angular_culling).
+    Both methods create the same graph.
+
+    If reduced is True, the graph does not contain vertices lying inside
+    obstacles and edges that are not tangent to obstacles at both ends
+    (see get_tangent_signs). No shortest path uses such vertices or
+    edges, so the paths found in reduced graph are just as short.
+
+    The graph is a dictionary of lists of Adjacency tuples. Searches
+    use a more compact IndexedVisibilityGraph with the same edges
+    (see get_indexed_visibility_graph).
     """
-    vertices = get_all_vertices(obstacles)
-    visited_vertices = set()
+    vertices, first_ids, second_ids, distances = find_visibility_edges(obstacles, method, reduced)
     graph = {v: [] for v in vertices}
-    for p1 in vertices:
-        visited_vertices.add(p1)
-        for p2 in vertices - visited_vertices:
-            check_connection_between_points(graph, obstacles, p1, p2)
+    for i, j, distance in zip(first_ids.tolist(), second_ids.tolist(), distances.tolist()):
+        graph[vertices[i]].append(Adjacency(distance, vertices[j]))
+        graph[vertices[j]].append(Adjacency(distance, vertices[i]))
     return graph
 
 
+def find_visibility_edges(obstacles, method='pairwise', reduced=False):
+    """
+    Finds the edges of the visibility graph for given obstacles.
+
+    Returns a sorted list of vertices and three arrays describing the
+    edges: ids (indices in the list) of the first and the second vertex
+    of each edge (the first id is always lower) and edge lengths.
+    See create_visibility_graph_for_obstacles for the description of arguments.
+    """
+    if method not in ('pairwise', 'angular'):
+        raise ValueError('Unknown visibility graph method: %r' % (method,))
+    vertices = sorted(get_graph_vertices(obstacles, reduced))
+    coordinates = np.array(vertices, dtype=float).reshape(-1, 2)
+    if reduced:
+        tangent_signs = get_tangent_signs(obstacles)
+    if method == 'angular':
+        obstacle_array = get_obstacle_array(obstacles)
+    else:
+        grid = get_obstacle_grid(obstacles)
+
+    first_ids, second_ids = [], []
+    for i, vertex in enumerate(vertices):
+        other_coordinates = coordinates[i + 1:]
+        if method == 'angular':
+            blocked = find_blocked_points(coordinates[i], other_coordinates, obstacle_array)
+        else:
+            blocked = grid.find_blocked_segments(coordinates[i], other_coordinates)
+        if reduced:
+            blocked |= ~find_tangent_points(vertex, vertices[i + 1:], tangent_signs)
+        visible = i + 1 + np.flatnonzero(~blocked)
+        first_ids.append(np.full(len(visible), i, dtype=np.int64))
+        second_ids.append(visible)
+    first_ids = np.concatenate(first_ids) if vertices else np.zeros(0, dtype=np.int64)
+    second_ids = np.concatenate(second_ids) if vertices else np.zeros(0, dtype=np.int64)
+    distances = np.linalg.norm(coordinates[second_ids] - coordinates[first_ids], axis=1)
+    return vertices, first_ids, second_ids, distances
+
+
+def create_visibility_graph_using_angular_culling(obstacles, reduced=False):
+    """
+    Creates a visibility graph for given obstacles, culling the obstacle tests by angle.
+
+    Every vertex is treated as an origin: other vertices are sorted by
+    the angle at which they are seen from it. An obstacle can only block
+    the vertices that lie within the range of angles it covers and that
+    are farther away than the obstacle itself. Since the vertices are
+    sorted, that range is found with a binary search and only those
+    vertices are tested against the obstacle (see find_blocked_points).
+    The closest obstacles are tested first, so most of the vertices are
+    found to be blocked by one of them and are not tested any further.
+
+    Unlike a rotational sweep (Lee's algorithm), this keeps no ordered
+    structure of active edges, so a vertex can be tested against more
+    than one obstacle (usually two or three of the closest ones).
+    """
+    return create_visibility_graph_for_obstacles(obstacles, 'angular', reduced)
+
+
+def find_blocked_points(origin, points, obstacle_array, epsilon=1e-9):
+    """
+    Checks which points are not visible from origin.
+
+    The points and origin are coordinate arrays, of shape (M, 2)
+    and (2,) respectively. Returns a boolean array of length M
+    (see find_blocking_obstacles).
+    """
+    return find_blocking_obstacles(origin, points, obstacle_array, epsilon) >= 0
+
+
+def find_blocking_obstacles(origin, points, obstacle_array, epsilon=1e-9):
+    """
+    Finds an obstacle blocking the view of each point from origin.
+
+    Returns an array of obstacle indices of length M, -1 for the points
+    visible from origin. Of the obstacles blocking a point, the one
+    found first (the closest one in its batch) is returned.
+    Only the (point, obstacle) pairs that pass the angular and
+    distance checks described in create_visibility_graph_using_angular_culling
+    are tested with segments_cross_paired_obstacles. The checks are
+    widened by epsilon, so that they never reject a crossing pair.
+
+    Obstacles are tested in the order of their distance from origin,
+    in batches growing twice each time. Points blocked by the obstacles
+    from one batch are not tested against the farther ones, and no
+    obstacle farther than all remaining points is tested at all.
+    """
+    blockers = np.full(len(points), -1)
+    if not len(points) or not len(obstacle_array):
+        return blockers
+
+    deltas = points - origin
+    distances = np.linalg.norm(deltas, axis=1)
+    angles = normalized_angles(deltas[:, 0], deltas[:, 1])
+
+    ox, oy = origin
+    up, down, left, right = obstacle_array.T
+    gaps = np.hypot(
+        np.maximum.reduce([left - ox, ox - right, np.zeros_like(left)]),
+        np.maximum.reduce([up - oy, oy - down, np.zeros_like(up)]))
+    corner_angles = normalized_angles(
+        np.stack([left, left, right, right], axis=1) - ox,
+        np.stack([up, down, up, down], axis=1) - oy)
+    low = corner_angles.min(axis=1)
+    high = corner_angles.max(axis=1)
+    contains_origin = (left <= ox) & (ox <= right) & (up <= oy) & (oy <= down)
+    wraps = (high - low > np.pi) & ~contains_origin
+    regular = ~wraps & ~contains_origin
+
+    # Obstacles seen across the negative x axis cover two ranges of angles:
+    # one ending at pi and one starting at -pi.
+    shifted_corner_angles = np.where(corner_angles < 0, corner_angles + 2 * np.pi, corner_angles)
+    wrapped_low = shifted_corner_angles.min(axis=1)[wraps]
+    wrapped_high = shifted_corner_angles.max(axis=1)[wraps] - 2 * np.pi
+
+    # Obstacles containing the origin cover all the angles.
+    indices = np.arange(len(obstacle_array))
+    interval_obstacles = np.concatenate([
+        indices[regular], indices[wraps], indices[wraps], indices[contains_origin]])
+    interval_low = np.concatenate([
+        low[regular], wrapped_low, np.full(wraps.sum(), -np.pi),
+        np.full(contains_origin.sum(), -np.pi)]) - epsilon
+    interval_high = np.concatenate([
+        high[regular], np.full(wraps.sum(), np.pi), wrapped_high,
+        np.full(contains_origin.sum(), np.pi)]) + epsilon
+    interval_order = np.argsort(gaps[interval_obstacles], kind='stable')
+
+    # Points not blocked yet, sorted by angle.
+    remaining = np.argsort(angles)
+    tested_pairs = 0
+    batch_start, batch_size = 0, ANGULAR_BATCH_SIZE
+    while batch_start < len(interval_order) and len(remaining):
+        batch = interval_order[batch_start:batch_start + batch_size]
+        batch_start += batch_size
+        batch_size *= 2
+        farthest = distances[remaining].max()
+        if gaps[interval_obstacles[batch[0]]] >= farthest + epsilon * (1 + farthest):
+            break
+
+        remaining_angles = angles[remaining]
+        first = np.searchsorted(remaining_angles, interval_low[batch], side='left')
+        counts = np.searchsorted(remaining_angles, interval_high[batch], side='right') - first
+        ends = np.cumsum(counts)
+        if not ends[-1]:
+            continue
+        chunk_bounds = np.searchsorted(ends, np.arange(MAX_BLOCK_SIZE, ends[-1], MAX_BLOCK_SIZE), side='right')
+        for chunk in np.split(np.arange(len(counts)), chunk_bounds):
+            chunk_counts = counts[chunk]
+            offsets = np.arange(chunk_counts.sum()) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            pair_points = remaining[np.repeat(first[chunk], chunk_counts) + offsets]
+            pair_obstacles = np.repeat(interval_obstacles[batch[chunk]], chunk_counts)
+
+            pair_distances = distances[pair_points]
+            close_enough = gaps[pair_obstacles] < pair_distances + epsilon * (1 + pair_distances)
+            close_enough &= blockers[pair_points] < 0
+            pair_points = pair_points[close_enough]
+            pair_obstacles = pair_obstacles[close_enough]
+
+            tested_pairs += len(pair_points)
+            crosses = segments_cross_paired_obstacles(origin, points[pair_points], obstacle_array[pair_obstacles])
+            # Pairs are ordered by the distance of obstacles, so assigning
+            # them in reverse leaves the closest blocker of each point.
+            blockers[pair_points[crosses][::-1]] = pair_obstacles[crosses][::-1]
+        remaining = remaining[blockers[remaining] < 0]
+    count_statistics('obstacles_culled', len(points) * len(obstacle_array) - tested_pairs)
+    return blockers
+
+
+def normalized_angles(x, y):
+    """
+    Returns angles of vectors (x, y), in range (-pi, pi].
+    """
+    angles = np.arctan2(y, x)
+    angles[angles == -np.pi] = np.pi
+    return angles
+
+
 def check_connection_between_points(graph, obstacles, point1, point2):
     """
     Checks if there is an unobstructed line between point1 and point2. If so, adds the adjacency to graph.
     """
-    crossed_obstacles = [obs for obs in obstacles if line_crosses_obstacle(point1, point2, obs)]
-    if not crossed_obstacles:
+    blocked = get_obstacle_grid(obstacles).find_blocked_segments(point1, [point2])
+    if not blocked[0]:
         distance = np.linalg.norm(np.subtract(point1, point2))
-        graph[point1].append(Adjacency(distance, point2))
-        graph[point2].append(Adjacency(distance, point1))
+        graph.setdefault(point1, []).append(Adjacency(distance, point2))
+        graph.setdefault(point2, []).append(Adjacency(distance, point1))
+
+
+def connect_point_to_points(graph, obstacles, point, other_points):
+    """
+    Adds adjacencies between point and every point from other_points that is visible from it.
+
+    Segments are tested only against the obstacles found near them by the obstacle grid.
+    """
+    if not other_points:
+        return
+    blocked = get_obstacle_grid(obstacles).find_blocked_segments(point, other_points)
+    distances = np.linalg.norm(np.subtract(other_points, point), axis=1)
+    for other_point, distance, is_blocked in zip(other_points, distances, blocked):
+        if not is_blocked:
+            graph.setdefault(point, []).append(Adjacency(distance, other_point))
+            graph.setdefault(other_point, []).append(Adjacency(distance, point))
 
 
-def add_vertex_to_visibility_graph(point, obstacles, graph):
+def add_vertex_to_visibility_graph(point, obstacles, graph, reduced=False):
     """
     Adds one vertex to visibility graph and calculates adjacent points for it.
+
+    If the graph is reduced, the vertex is connected only to the corners
+    at which the connecting line is tangent to the obstacles.
     """
-    points = set(graph.keys())
+    points = list(graph.keys())
+    if reduced:
+        tangent = find_tangent_points(point, points, get_tangent_signs(obstacles))
+        points = [p for p, is_tangent in zip(points, tangent) if is_tangent]
     graph[point] = []
-    for existing_point in points:
-        check_connection_between_points(graph, obstacles, point, existing_point)
+    connect_point_to_points(graph, obstacles, point, points)
 
 
 def line_crosses_obstacle(point1, point2, obstacle, threshold=1e-10):
@@ -265,6 +2463,154 @@ def line_crosses_obstacle(point1, point2, obstacle, threshold=1e-10):
             tymax = np.multiply(ay, obstacle.up - e.y)
 
     intervals_intersect = txmin < tymax - threshold and tymin < txmax - threshold
-    intervals_are_valid = txmin < d_len and tymin < d_len and txmax > 0 and tymax > 0
+    intervals_are_valid = (txmin < d_len - threshold and tymin < d_len - threshold
+                           and txmax > threshold and tymax > threshold)
 
     return intervals_intersect and intervals_are_valid
+
+
+def get_cached_indexed_visibility_graph(obstacles, method='pairwise', reduced=False):
+    """
+    Returns an IndexedVisibilityGraph for given obstacles from cache, creating it if necessary.
+
+    Works like get_indexed_visibility_graph, but also records cache hits
+    and misses and the time of creating the graph (if statistics are collected).
+    """
+    if active_statistics is None:
+        return get_indexed_visibility_graph(obstacles, method, reduced)
+    misses = get_indexed_visibility_graph.cache_info().misses
+    with measure_stage('visibility_graph'):
+        graph = get_indexed_visibility_graph(obstacles, method, reduced)
+    is_hit = get_indexed_visibility_graph.cache_info().misses == misses
+    count_statistics('graph_cache_hits' if is_hit else 'graph_cache_misses')
+    return graph
+
+
+@lru_cache(maxsize=8)
+def get_indexed_visibility_graph(obstacles, method='pairwise', reduced=False):
+    """
+    Returns an IndexedVisibilityGraph for given obstacles (see create_indexed_visibility_graph).
+    """
+    return create_indexed_visibility_graph(obstacles, method, reduced)
+
+
+def create_indexed_visibility_graph(obstacles, method='pairwise', reduced=False):
+    """
+    Creates an IndexedVisibilityGraph for given obstacles (see create_visibility_graph_for_obstacles).
+
+    The graph is created directly from the arrays of edges,
+    without creating a dictionary of Adjacency tuples first.
+    """
+    vertices, first_ids, second_ids, distances = find_visibility_edges(obstacles, method, reduced)
+    sources = np.concatenate([first_ids, second_ids])
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(len(vertices) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(sources, minlength=len(vertices)))
+    neighbour_ids = np.concatenate([second_ids, first_ids])[order].astype(np.int32)
+    distances = np.concatenate([distances, distances])[order]
+    coordinates = np.array(vertices, dtype=float).reshape(-1, 2)
+    return IndexedVisibilityGraph(coordinates, offsets, neighbour_ids, distances, vertices)
+
+
+@lru_cache(maxsize=8)
+def get_lazy_visibility_graph(obstacles, method='pairwise', reduced=False):
+    """
+    Returns a LazyVisibilityGraph for given obstacles.
+
+    The same graph is returned for the same obstacles, so neighbours
+    of vertices found by one search are reused by the next ones.
+    """
+    return LazyVisibilityGraph(obstacles, method, reduced)
+
+
+@lru_cache(maxsize=8)
+def get_shortest_path_table(obstacles, method='pairwise', reduced=False):
+    """
+    Returns a ShortestPathTable for the visibility graph of given obstacles.
+    """
+    return ShortestPathTable(get_indexed_visibility_graph(obstacles, method, reduced))
+
+
+@lru_cache(maxsize=8)
+def get_visibility_field(obstacles, method='pairwise', reduced=False, cell_size=None):
+    """
+    Returns a VisibilityField for the visibility graph of given obstacles.
+    """
+    return VisibilityField(obstacles, get_indexed_visibility_graph(obstacles, method, reduced), cell_size, reduced)
+
+
+@lru_cache(maxsize=8)
+def get_obstacle_grid(obstacles):
+    """
+    Returns an ObstacleGrid for given obstacles.
+
+    Like the visibility graph, the grid is created only once for each set of obstacles.
+    """
+    return ObstacleGrid(obstacles)
+
+
+@lru_cache(maxsize=8)
+def get_obstacle_array(obstacles):
+    """
+    Returns given obstacles as one contiguous (N, 4) array of floats.
+
+    Columns follow the order of Obstacle fields: up, down, left, right.
+    """
+    return np.array(obstacles, dtype=float).reshape(-1, 4)
+
+
+def segments_cross_obstacles(starts, ends, obstacle_array, threshold=1e-10):
+    """
+    Checks which obstacles are crossed by which segments.
+
+    This is a vectorized version of line_crosses_obstacle: the segment
+    from starts[i] to ends[i] is tested against all obstacles of
+    obstacle_array (as returned by get_obstacle_array) at once.
+    Returns an (M, N) boolean array, where M is the number of
+    segments and N is the number of obstacles.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 1, 2)
+    return segments_cross_paired_obstacles(starts, ends, obstacle_array, threshold)
+
+
+def segments_cross_paired_obstacles(starts, ends, obstacle_array, threshold=1e-10):
+    """
+    Checks if the segment from starts[i] to ends[i] crosses the obstacle obstacle_array[i].
+
+    Points are arrays with 2 values in the last dimension and obstacles
+    are arrays with 4 values in the last dimension (in the order of
+    Obstacle fields). All the arrays are broadcast against each other.
+    """
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    obstacle_array = np.asarray(obstacle_array, dtype=float)
+    up, down, left, right = (obstacle_array[..., i] for i in range(4))
+
+    d = ends - starts
+    d_len = np.linalg.norm(d, axis=-1)
+    ex = starts[..., 0]
+    ey = starts[..., 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = d / d_len[..., np.newaxis]
+        ax = 1 / d[..., 0]
+        ay = 1 / d[..., 1]
+
+        t_left = ax * (left - ex)
+        t_right = ax * (right - ex)
+        t_up = ay * (up - ey)
+        t_down = ay * (down - ey)
+
+        txmin = np.where(ax >= 0, t_left, t_right)
+        txmax = np.where(ax >= 0, t_right, t_left)
+        tymin = np.where(ay >= 0, t_up, t_down)
+        tymax = np.where(ay >= 0, t_down, t_up)
+
+        intervals_intersect = (txmin < tymax - threshold) & (tymin < txmax - threshold)
+        intervals_are_valid = (
+            (txmin < d_len - threshold) & (tymin < d_len - threshold) & (txmax > threshold) & (tymax > threshold))
+
+    result = intervals_intersect & intervals_are_valid & (d_len > 0)
+    count_statistics('intersection_tests', result.size)
+    return result
@@ -0,0 +1,95 @@
+from pathfinder import find_path, get_indexed_visibility_graph
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+
+class AsyncPlanner:
+    """
+    Calculates paths in an executor, so that an asyncio event loop is never blocked.
+
+    Identical queries that are calculated at the same time are merged:
+    the path is calculated once and all callers get the same result.
+    A query can be made on behalf of an agent (any hashable id). When the
+    same agent makes a new query, its previous query is cancelled.
+    A calculation is cancelled (if it has not started yet) when no caller
+    is waiting for its result anymore.
+
+    The executor defaults to a ThreadPoolExecutor with one thread.
+    A ProcessPoolExecutor can be used as well.
+    """
+    def __init__(self, executor=None, method='pairwise', reduced=False):
+        self.owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.method = method
+        self.reduced = reduced
+        # Calculations in progress: key -> [future, number of waiting callers].
+        self.calculations = {}
+        # Tasks of the latest query of each agent.
+        self.agent_queries = {}
+
+    async def plan(self, start, destination, obstacles, agent=None):
+        """
+        Calculates the path between start and destination, avoiding the obstacles (see pathfinder.find_path).
+
+        If agent is given, the previous query made for that agent is
+        cancelled (its caller gets asyncio.CancelledError). Each query
+        runs in its own task, so only the query is cancelled, not the
+        task of its caller.
+        """
+        query = asyncio.ensure_future(self.calculate(
+            ('path', start, destination, obstacles),
+            find_path, start, destination, obstacles, self.method, self.reduced))
+        if agent is not None:
+            previous_query = self.agent_queries.get(agent)
+            if previous_query is not None:
+                previous_query.cancel()
+            self.agent_queries[agent] = query
+        try:
+            return await query
+        finally:
+            if agent is not None and self.agent_queries.get(agent) is query:
+                del self.agent_queries[agent]
+
+    async def prepare(self, obstacles):
+        """
+        Creates the visibility graph for obstacles in the executor.
+
+        Awaiting this before the first query for a new map keeps the
+        graph creation out of latency-sensitive handlers. It is useful
+        only with a ThreadPoolExecutor (processes do not share caches).
+        """
+        await self.calculate(
+            ('graph', obstacles), get_indexed_visibility_graph, obstacles, self.method, self.reduced)
+
+    async def calculate(self, key, function, *args):
+        """
+        Returns the result of function(*args) calculated in the executor, merging identical calculations.
+        """
+        calculation = self.calculations.get(key)
+        if calculation is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            calculation = self.calculations[key] = [future, 0]
+            future.add_done_callback(lambda _: self.remove_calculation(key, calculation))
+        calculation[1] += 1
+        try:
+            return await asyncio.shield(calculation[0])
+        finally:
+            calculation[1] -= 1
+            if not calculation[1]:
+                calculation[0].cancel()
+
+    def remove_calculation(self, key, calculation):
+        """
+        Forgets a finished calculation.
+        """
+        if self.calculations.get(key) is calculation:
+            del self.calculations[key]
+
+    def close(self):
+        """
+        Shuts the executor down, if it was created by the planner.
+
+        An executor passed to the planner is left to its owner.
+        """
+        if self.owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
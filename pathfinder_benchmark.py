@@ -0,0 +1,295 @@
+from pathfinder import Obstacle, Point, Agent, Swarm, SearchBuffers
+from pathfinder import inflate_obstacles, create_indexed_visibility_graph, get_obstacle_grid
+from pathfinder import find_endpoint_adjacencies, find_path_using_indexed_graph
+import numpy as np
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+RESULTS_VERSION = 1
+# Distance between neighbouring obstacles (or cells of a maze), in pixels.
+SPACING = 40
+
+
+def generate_random_map(count, seed=0):
+    """
+    Creates count obstacles of random sizes placed randomly on a square map.
+
+    The map grows with the number of obstacles, so that their density stays the same.
+    """
+    generator = random.Random(seed)
+    side = SPACING * math.sqrt(count)
+    obstacles = []
+    for _ in range(count):
+        x, y = generator.uniform(0, side), generator.uniform(0, side)
+        width, height = generator.uniform(2, SPACING / 2), generator.uniform(2, SPACING / 2)
+        obstacles.append(Obstacle(y, y + height, x, x + width))
+    return tuple(obstacles)
+
+
+def generate_maze_map(count, seed=0):
+    """
+    Creates a maze with about count walls.
+
+    The maze is a square grid of cells. Walls between cells are removed
+    along a random spanning tree of the cells (found with a depth-first
+    search), so every cell can be reached from every other. Each of the
+    remaining walls (and each side of the outer border) is one obstacle.
+    """
+    generator = random.Random(seed)
+    size = max(2, math.ceil(math.sqrt(count)))
+    walls = {('v', x, y) for x in range(1, size) for y in range(size)}
+    walls |= {('h', x, y) for x in range(size) for y in range(1, size)}
+    visited = {(0, 0)}
+    stack = [(0, 0)]
+    while stack:
+        x, y = stack[-1]
+        neighbours = [
+            (nx, ny) for nx, ny in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+            if 0 <= nx < size and 0 <= ny < size and (nx, ny) not in visited]
+        if not neighbours:
+            stack.pop()
+            continue
+        nx, ny = generator.choice(neighbours)
+        if nx != x:
+            walls.discard(('v', max(x, nx), y))
+        else:
+            walls.discard(('h', x, max(y, ny)))
+        visited.add((nx, ny))
+        stack.append((nx, ny))
+
+    thickness = SPACING / 8
+    obstacles = []
+    for direction, x, y in sorted(walls):
+        if direction == 'v':
+            obstacles.append(Obstacle(
+                y * SPACING, (y + 1) * SPACING, x * SPACING - thickness, x * SPACING + thickness))
+        else:
+            obstacles.append(Obstacle(
+                y * SPACING - thickness, y * SPACING + thickness, x * SPACING, (x + 1) * SPACING))
+    side = size * SPACING
+    obstacles += [
+        Obstacle(-thickness, thickness, 0, side), Obstacle(side - thickness, side + thickness, 0, side),
+        Obstacle(0, side, -thickness, thickness), Obstacle(0, side, side - thickness, side + thickness)]
+    generator.shuffle(obstacles)
+    return tuple(obstacles[:count])
+
+
+def generate_rooms_map(count, seed=0):
+    """
+    Creates a grid of rooms, separated by walls with doors, using about count obstacles.
+
+    Each room is bounded by walls with one door in each of them,
+    so every wall consists of two obstacles. The position of each
+    door is random.
+    """
+    generator = random.Random(seed)
+    # A grid of size x size rooms uses 4 * size * (size + 1) obstacles.
+    size = max(1, round((math.sqrt(1 + count) - 1) / 2))
+    room_size = 4 * SPACING
+    door_size = SPACING
+    thickness = SPACING / 8
+    obstacles = []
+    for line in range(size + 1):
+        for room in range(size):
+            door = room * room_size + generator.uniform(thickness, room_size - door_size - thickness)
+            for low, high in [(room * room_size, door), (door + door_size, (room + 1) * room_size)]:
+                position = line * room_size
+                obstacles.append(Obstacle(position - thickness, position + thickness, low, high))
+                obstacles.append(Obstacle(low, high, position - thickness, position + thickness))
+    return tuple(obstacles)
+
+
+MAP_GENERATORS = {
+    'random': generate_random_map,
+    'maze': generate_maze_map,
+    'rooms': generate_rooms_map,
+}
+
+
+def generate_queries(obstacles, count, seed=0):
+    """
+    Creates count (start, destination) pairs of random points lying outside the obstacles.
+    """
+    generator = random.Random(seed)
+    array = np.array(obstacles, dtype=float).reshape(-1, 4)
+    up, down, left, right = array[:, 0].min(), array[:, 1].max(), array[:, 2].min(), array[:, 3].max()
+    grid = get_obstacle_grid(obstacles)
+    points = []
+    while len(points) < 2 * count:
+        candidates = [Point(generator.uniform(left, right), generator.uniform(up, down)) for _ in range(2 * count)]
+        inside = grid.find_points_inside_obstacles(candidates)
+        points += [point for point, is_inside in zip(candidates, inside) if not is_inside]
+    return list(zip(points[0:2 * count:2], points[1:2 * count:2]))
+
+
+def run_benchmark(map_type, obstacle_count, query_count=100, seed=0, agent_size=5, steps=100, measure_memory=True,
+                  method='pairwise', reduced=False):
+    """
+    Measures all stages of pathfinding on one generated map.
+
+    The method and reduced arguments select how the visibility graph
+    is built (see pathfinder.create_visibility_graph_for_obstacles).
+    Returns a dictionary with the time of each stage (in seconds),
+    throughput of path queries, peak memory used while creating the
+    visibility graph and the size of the graph, all in bytes.
+
+    Tracing memory allocations slows the program down a lot, so the peak
+    memory is measured while creating the graph again, after it is timed.
+    This is skipped if measure_memory is False.
+    """
+    obstacles = MAP_GENERATORS[map_type](obstacle_count, seed)
+    stages = {}
+
+    started = time.perf_counter()
+    obstacles_in_configuration_space = inflate_obstacles(obstacles, agent_size, agent_size)
+    stages['configuration_space'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    graph = create_indexed_visibility_graph(obstacles_in_configuration_space, method, reduced)
+    stages['visibility_graph'] = time.perf_counter() - started
+
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+        create_indexed_visibility_graph(obstacles_in_configuration_space, method, reduced)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    queries = generate_queries(obstacles_in_configuration_space, query_count, seed)
+    started = time.perf_counter()
+    endpoint_adjacencies = [
+        find_endpoint_adjacencies([start, destination], obstacles_in_configuration_space, graph, reduced)
+        for start, destination in queries]
+    stages['endpoint_visibility'] = time.perf_counter() - started
+
+    buffers = SearchBuffers(len(graph.nodes) + 2)
+    started = time.perf_counter()
+    paths = [
+        find_path_using_indexed_graph(
+            start, destination, graph, start_adjacencies, {i: d for d, i in destination_adjacencies}, buffers)
+        for (start, destination), (start_adjacencies, destination_adjacencies) in zip(queries, endpoint_adjacencies)]
+    stages['search'] = time.perf_counter() - started
+
+    agents = []
+    for (start, _), path in zip(queries, paths):
+        agent = Agent(start, agent_size, agent_size, velocity=SPACING / 10)
+        agent.path = list(path or [])
+        agents.append(agent)
+    swarm = Swarm()
+    for agent in agents:
+        swarm.add_agent(agent.position, agent.velocity, agent.path)
+    started = time.perf_counter()
+    for _ in range(steps):
+        for agent in agents:
+            agent.move_along_path()
+    stages['move_along_path'] = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(steps):
+        swarm.step()
+    stages['swarm_step'] = time.perf_counter() - started
+
+    query_time = stages['endpoint_visibility'] + stages['search']
+    return {
+        'map': map_type,
+        'obstacles': obstacle_count,
+        'seed': seed,
+        'method': method,
+        'reduced': reduced,
+        'vertices': len(graph.nodes),
+        'edges': len(graph.neighbour_ids) // 2,
+        'queries': query_count,
+        'paths_found': sum(path is not None for path in paths),
+        'stages': stages,
+        'throughput': {
+            'queries_per_second': query_count / query_time if query_time else None,
+            'agent_steps_per_second': len(agents) * steps / stages['swarm_step'] if stages['swarm_step'] else None,
+        },
+        'memory': {
+            'visibility_graph_peak': peak_memory,
+            'visibility_graph_size': sum(array.nbytes for array in graph.get_arrays().values()),
+        },
+    }
+
+
+def run_benchmarks(map_types, obstacle_counts, query_count=100, seed=0, measure_memory=True, method='pairwise',
+                   reduced=False):
+    """
+    Runs run_benchmark for each map type and number of obstacles and returns results ready to be saved as JSON.
+    """
+    return {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': [
+            run_benchmark(
+                map_type, obstacle_count, query_count, seed, measure_memory=measure_memory, method=method,
+                reduced=reduced)
+            for map_type in map_types for obstacle_count in obstacle_counts],
+    }
+
+
+def compare_results(old_results, new_results, tolerance=0.2):
+    """
+    Returns a list of descriptions of stages that became slower by more than tolerance (a fraction).
+
+    Results are matched by map type, number of obstacles, seed and the way the graph is built.
+    """
+    def get_key(run):
+        return run['map'], run['obstacles'], run['seed'], run.get('method', 'pairwise'), run.get('reduced', False)
+
+    old_runs = {get_key(run): run for run in old_results['results']}
+    regressions = []
+    for run in new_results['results']:
+        old_run = old_runs.get(get_key(run))
+        if old_run is None:
+            continue
+        for stage, duration in run['stages'].items():
+            old_duration = old_run['stages'].get(stage)
+            if old_duration and duration > old_duration * (1 + tolerance):
+                regressions.append('%s map with %d obstacles: %s took %.4f s instead of %.4f s' % (
+                    run['map'], run['obstacles'], stage, duration, old_duration))
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Measures the performance of pathfinding on generated maps.')
+    parser.add_argument('--maps', nargs='+', choices=sorted(MAP_GENERATORS), default=sorted(MAP_GENERATORS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000], help='numbers of obstacles')
+    parser.add_argument('--queries', type=int, default=100, help='number of path queries per map')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--method', choices=['pairwise', 'angular'], default='pairwise',
+                        help='how the visibility graph is built')
+    parser.add_argument('--reduced', action='store_true', help='build the reduced visibility graph')
+    parser.add_argument('--skip-memory', action='store_true', help='do not measure peak memory (saves time)')
+    parser.add_argument('--output', help='file to write the results to (JSON)')
+    parser.add_argument('--compare', help='file with previous results to compare with')
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(
+        arguments.maps, arguments.sizes, arguments.queries, arguments.seed, not arguments.skip_memory,
+        arguments.method, arguments.reduced)
+    for run in results['results']:
+        print('%-6s %6d obstacles, %s%s graph: %s, %.1f queries/s' % (
+            run['map'], run['obstacles'], run['method'], ' reduced' if run['reduced'] else '',
+            ', '.join('%s %.4f s' % stage for stage in run['stages'].items()),
+            run['throughput']['queries_per_second'] or 0))
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if arguments.compare:
+        with open(arguments.compare) as previous_file:
+            regressions = compare_results(json.load(previous_file), results)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+from pathfinder import Obstacle, Point, ObstacleGrid, distance_estimate, shortcut_path
+from pathfinder import create_indexed_visibility_graph, find_paths_using_indexed_graph, get_obstacle_array
+from collections import OrderedDict
+import heapq
+import math
+
+
+class HierarchicalPlanner:
+    """
+    Finds paths on large maps using a hierarchy of regions (like HPA* algorithm).
+
+    The map is divided into square regions of region_size (the cells of
+    an ObstacleGrid). Each region contains only the obstacles overlapping
+    it and is closed by four walls placed just outside its sides, so
+    paths found within a region never leave it. Points on the sides
+    shared by neighbouring regions, not covered by obstacles, are used
+    as portals between the regions. There is at least one portal in each
+    free part of a side, and more if that part is longer than portal_spacing.
+
+    Lengths of paths between all portals of each region are calculated
+    once (each region has its own small visibility graph). Only the graphs
+    of max_cached_regions recently used regions are kept in memory.
+    To find a path, start and destination are connected to the portals
+    of their regions and the shortest sequence of portals is found in the
+    graph of portals. Then the path between each two consecutive portals
+    is found within their common region. The cost of a query depends on
+    the number of regions crossed, not on the size of the map. The paths
+    are not always the shortest ones, since they have to pass through portals.
+    If shortcut_paths is True, they are shortened with shortcut_path.
+
+    The regions cover the bounding box of all obstacles and the bounds
+    (left, up, right, down) of the map if they are given, with one more
+    region on each side, so paths can go around obstacles at the edges.
+    Bounds are required if there are no obstacles. Points outside of the
+    regions are rejected with ValueError, so bounds should contain all
+    points that are used.
+    """
+    def __init__(self, obstacles, region_size, portal_spacing=None, method='pairwise', reduced=False,
+                 max_cached_regions=256, shortcut_paths=False, bounds=None):
+        self.obstacles = tuple(obstacles)
+        self.grid = ObstacleGrid(self.obstacles, region_size, self.find_map_bounds(bounds, region_size))
+        self.region_size = self.grid.cell_size
+        self.portal_spacing = portal_spacing or self.region_size / 2
+        self.method = method
+        self.reduced = reduced
+        self.max_cached_regions = max_cached_regions
+        self.shortcut_paths = shortcut_paths
+        self.region_obstacles = {}
+        self.region_graphs = OrderedDict()
+        self.portals = []
+        self.region_portals = {}
+        # Adjacencies of portals: lists of (distance, portal id, region) tuples.
+        self.portal_adjacencies = []
+        self.create_portals()
+        self.connect_portals()
+
+    def find_map_bounds(self, bounds, region_size):
+        """
+        Returns bounds (left, up, right, down) covering obstacles and given bounds, with a margin of one region.
+        """
+        up, down, left, right = get_obstacle_array(self.obstacles).T
+        if bounds is None:
+            if not len(self.obstacles):
+                raise ValueError('Bounds are required for a map without obstacles')
+            bounds = (math.inf, math.inf, -math.inf, -math.inf)
+        return (
+            float(left.min(initial=bounds[0])) - region_size,
+            float(up.min(initial=bounds[1])) - region_size,
+            float(right.max(initial=bounds[2])) + region_size,
+            float(down.max(initial=bounds[3])) + region_size,
+        )
+
+    def create_portals(self):
+        """
+        Places portals on the sides shared by neighbouring regions.
+        """
+        columns, rows = self.grid.shape
+        for x in range(columns):
+            for y in range(rows):
+                left, up, right, down = self.get_region_bounds((x, y))
+                if x + 1 < columns:
+                    obstacles = self.find_obstacles_crossing_line(0, right, [(x, y), (x + 1, y)])
+                    for position in self.find_portal_positions(up, down, [(o.up, o.down) for o in obstacles]):
+                        self.add_portal(Point(right, position), [(x, y), (x + 1, y)])
+                if y + 1 < rows:
+                    obstacles = self.find_obstacles_crossing_line(1, down, [(x, y), (x, y + 1)])
+                    for position in self.find_portal_positions(left, right, [(o.left, o.right) for o in obstacles]):
+                        self.add_portal(Point(position, down), [(x, y), (x, y + 1)])
+
+    def find_obstacles_crossing_line(self, axis, position, regions):
+        """
+        Returns obstacles from given regions whose interior crosses the line x = position (or y = position).
+        """
+        obstacles = set()
+        for region in regions:
+            obstacles.update(self.find_region_obstacles(region))
+        if axis == 0:
+            return [o for o in obstacles if o.left < position < o.right]
+        return [o for o in obstacles if o.up < position < o.down]
+
+    def find_portal_positions(self, low, high, blocked_intervals):
+        """
+        Returns positions of portals on a side from low to high, with given intervals covered by obstacles.
+        """
+        positions = []
+        free_start = low
+        for blocked_low, blocked_high in sorted(blocked_intervals) + [(high, high)]:
+            if blocked_low > free_start:
+                free_end = min(blocked_low, high)
+                count = max(1, math.ceil((free_end - free_start) / self.portal_spacing))
+                step = (free_end - free_start) / count
+                positions += [free_start + (i + 0.5) * step for i in range(count)]
+            free_start = max(free_start, blocked_high)
+            if free_start >= high:
+                break
+        return positions
+
+    def add_portal(self, point, regions):
+        """
+        Adds a portal at given point, shared by given regions.
+        """
+        portal_id = len(self.portals)
+        self.portals.append(point)
+        self.portal_adjacencies.append([])
+        for region in regions:
+            self.region_portals.setdefault(region, []).append(portal_id)
+
+    def connect_portals(self):
+        """
+        Calculates lengths of paths between all portals of each region.
+        """
+        for region, portal_ids in self.region_portals.items():
+            pairs = [(i, j) for k, i in enumerate(portal_ids) for j in portal_ids[k + 1:]]
+            paths = self.find_local_paths(region, [(self.portals[i], self.portals[j]) for i, j in pairs])
+            for (i, j), path in zip(pairs, paths):
+                if path is not None:
+                    distance = get_path_length(self.portals[i], path)
+                    self.portal_adjacencies[i].append((distance, j, region))
+                    self.portal_adjacencies[j].append((distance, i, region))
+
+    def get_region(self, point):
+        """
+        Returns the region (a pair of grid cell coordinates) containing given point.
+
+        Raises ValueError if the point lies outside of all regions.
+        """
+        region = tuple(math.floor((point[axis] - self.grid.origin[axis]) / self.region_size) for axis in range(2))
+        for axis in range(2):
+            if region[axis] == self.grid.shape[axis] and point[axis] == self.grid.origin[axis] + \
+                    self.grid.shape[axis] * self.region_size:
+                region = region[:axis] + (region[axis] - 1, ) + region[axis + 1:]
+            if not 0 <= region[axis] < self.grid.shape[axis]:
+                raise ValueError('Point %r lies outside of the map (see the bounds of HierarchicalPlanner)' % (point, ))
+        return region
+
+    def get_region_bounds(self, region):
+        """
+        Returns the bounds (left, up, right, down) of given region.
+        """
+        left = float(self.grid.origin[0] + region[0] * self.region_size)
+        up = float(self.grid.origin[1] + region[1] * self.region_size)
+        return left, up, left + self.region_size, up + self.region_size
+
+    def find_region_obstacles(self, region):
+        """
+        Returns the obstacles overlapping given region.
+        """
+        left, up, right, down = self.get_region_bounds(region)
+        cell = region[0] * self.grid.shape[1] + region[1]
+        indices = self.grid.cell_obstacles[self.grid.cell_offsets[cell]:self.grid.cell_offsets[cell + 1]]
+        obstacles = [self.obstacles[i] for i in indices.tolist()]
+        return [o for o in obstacles if o.left < right and left < o.right and o.up < down and up < o.down]
+
+    def get_region_obstacles(self, region):
+        """
+        Returns the obstacles used for finding paths within given region: its obstacles and the walls around it.
+        """
+        if region not in self.region_obstacles:
+            left, up, right, down = self.get_region_bounds(region)
+            size = self.region_size
+            # The walls overlap, since paths could pass between touching walls.
+            walls = [
+                Obstacle(up - size, up, left - size, right + size),
+                Obstacle(down, down + size, left - size, right + size),
+                Obstacle(up - size, down + size, left - size, left),
+                Obstacle(up - size, down + size, right, right + size),
+            ]
+            self.region_obstacles[region] = tuple(self.find_region_obstacles(region) + walls)
+        return self.region_obstacles[region]
+
+    def get_region_graph(self, region):
+        """
+        Returns the indexed visibility graph for given region, creating it if it is not cached.
+        """
+        if region in self.region_graphs:
+            self.region_graphs.move_to_end(region)
+        else:
+            self.region_graphs[region] = create_indexed_visibility_graph(
+                self.get_region_obstacles(region), self.method, self.reduced)
+            while len(self.region_graphs) > self.max_cached_regions:
+                self.region_graphs.popitem(last=False)
+        return self.region_graphs[region]
+
+    def find_local_paths(self, region, pairs):
+        """
+        Calculates paths for (start, destination) pairs that do not leave given region (see pathfinder.find_paths).
+        """
+        if not pairs:
+            return []
+        return find_paths_using_indexed_graph(
+            pairs, self.get_region_obstacles(region), self.get_region_graph(region), self.reduced)
+
+    def find_path(self, start, destination):
+        """
+        Calculates a path between start and destination (see pathfinder.find_path).
+
+        Raises ValueError if start or destination lies outside of the map.
+        """
+        if start == destination:
+            return []
+        start_region = self.get_region(start)
+        destination_region = self.get_region(destination)
+        start_portals = self.region_portals.get(start_region, [])
+        start_paths = dict(zip(start_portals, self.find_local_paths(
+            start_region, [(start, self.portals[i]) for i in start_portals])))
+        destination_portals = self.region_portals.get(destination_region, [])
+        destination_paths = dict(zip(destination_portals, self.find_local_paths(
+            destination_region, [(destination, self.portals[i]) for i in destination_portals])))
+
+        direct_path = None
+        if start_region == destination_region:
+            direct_path = self.find_local_paths(start_region, [(start, destination)])[0]
+
+        portal_ids = self.find_portal_sequence(start, destination, start_paths, destination_paths, direct_path)
+        if portal_ids is None:
+            return None
+        if not portal_ids:
+            return direct_path
+
+        path = list(start_paths[portal_ids[0]])
+        for i, j in zip(portal_ids, portal_ids[1:]):
+            region = min((a for a in self.portal_adjacencies[i] if a[1] == j), key=lambda a: a[0])[2]
+            path += self.find_local_paths(region, [(self.portals[i], self.portals[j])])[0]
+        last_path = [destination] + destination_paths[portal_ids[-1]]
+        path += last_path[-2::-1]
+        return shortcut_path(start, path, self.obstacles) if self.shortcut_paths else path
+
+    def find_portal_sequence(self, start, destination, start_paths, destination_paths, direct_path):
+        """
+        Finds the shortest sequence of portals leading from start to destination (A* in the graph of portals).
+
+        Returns a list of portal ids, an empty list if the direct path
+        within one region is shorter, or None if there is no path.
+        """
+        start_id = len(self.portals)
+        destination_id = start_id + 1
+        destination_distances = {
+            i: get_path_length(destination, path) for i, path in destination_paths.items() if path is not None}
+        start_adjacencies = [
+            (get_path_length(start, path), i) for i, path in start_paths.items() if path is not None]
+        if direct_path is not None:
+            start_adjacencies.append((get_path_length(start, direct_path), destination_id))
+
+        distance_from_start = {start_id: 0.0}
+        came_from = {}
+        visited = set()
+        nodes_to_visit = [(distance_estimate(start, destination), start_id)]
+        while nodes_to_visit:
+            _, current_id = heapq.heappop(nodes_to_visit)
+            if current_id in visited:
+                continue
+            if current_id == destination_id:
+                portal_ids = []
+                current_id = came_from[destination_id]
+                while current_id != start_id:
+                    portal_ids.append(current_id)
+                    current_id = came_from[current_id]
+                portal_ids.reverse()
+                return portal_ids
+            visited.add(current_id)
+
+            if current_id == start_id:
+                adjacencies = start_adjacencies
+            else:
+                adjacencies = [(distance, i) for distance, i, _ in self.portal_adjacencies[current_id]]
+                if current_id in destination_distances:
+                    adjacencies.append((destination_distances[current_id], destination_id))
+            for distance, neighbour_id in adjacencies:
+                if neighbour_id in visited:
+                    continue
+                neighbour_distance = distance_from_start[current_id] + distance
+                if neighbour_distance < distance_from_start.get(neighbour_id, float('inf')):
+                    distance_from_start[neighbour_id] = neighbour_distance
+                    came_from[neighbour_id] = current_id
+                    neighbour = destination if neighbour_id == destination_id else self.portals[neighbour_id]
+                    heapq.heappush(
+                        nodes_to_visit, (neighbour_distance + distance_estimate(neighbour, destination), neighbour_id))
+        return None
+
+
+def get_path_length(start, path):
+    """
+    Returns the length of path (a list of points, not containing start) starting at given point.
+    """
+    return sum(distance_estimate(p1, p2) for p1, p2 in zip([start] + path, path))
@@ -0,0 +1,101 @@
+from pathfinder import IndexedVisibilityGraph, get_indexed_visibility_graph, find_paths_using_indexed_graph
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import os
+
+# Graph attached by a worker process (see attach_worker_to_graph).
+worker_state = {}
+
+
+class SharedVisibilityGraph:
+    """
+    Publishes arrays of an IndexedVisibilityGraph in shared memory.
+
+    The description attribute contains everything other processes
+    need to attach to the arrays (see attach_visibility_graph):
+    a name of shared memory block, a shape and a type of each array.
+    The shared memory is released when the object is closed (it can
+    be used as a context manager).
+    """
+    def __init__(self, graph):
+        self.blocks = []
+        self.description = {}
+        for name, array in graph.get_arrays().items():
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            self.blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.description[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """
+        Releases the shared memory.
+        """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_visibility_graph(description):
+    """
+    Creates an IndexedVisibilityGraph using arrays published by SharedVisibilityGraph.
+
+    The arrays are not copied. Returns the graph and a list of shared
+    memory blocks, which have to be kept open as long as the graph is used.
+    """
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in description.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    return IndexedVisibilityGraph(**arrays), blocks
+
+
+def attach_worker_to_graph(description, obstacles, reduced):
+    """
+    Initializes a worker process: attaches it to the shared graph.
+    """
+    graph, blocks = attach_visibility_graph(description)
+    worker_state.update(graph=graph, blocks=blocks, obstacles=obstacles, reduced=reduced)
+
+
+def find_paths_in_worker(pairs):
+    """
+    Calculates paths for given pairs using the graph attached by the worker process.
+    """
+    return find_paths_using_indexed_graph(
+        pairs, worker_state['obstacles'], worker_state['graph'], worker_state['reduced'])
+
+
+def find_paths_in_parallel(pairs, obstacles, method='pairwise', reduced=False, workers=None, chunk_size=None):
+    """
+    Calculates paths for many (start, destination) pairs using a pool of processes.
+
+    Works like pathfinder.find_paths. The visibility graph for obstacles
+    is created once, in the calling process, and shared with the
+    workers without copying. The pairs are split into chunks of
+    chunk_size pairs (by default, four chunks per worker) and each
+    chunk is solved by one worker. The number of workers defaults
+    to the number of CPUs.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, -(-len(pairs) // (4 * workers)))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+    graph = get_indexed_visibility_graph(obstacles, method, reduced)
+    with SharedVisibilityGraph(graph) as shared_graph:
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=attach_worker_to_graph,
+                initargs=(shared_graph.description, obstacles, reduced)) as executor:
+            return [path for chunk_paths in executor.map(find_paths_in_worker, chunks) for path in chunk_paths]
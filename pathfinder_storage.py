@@ -0,0 +1,101 @@
+from pathfinder import IndexedVisibilityGraph, get_indexed_visibility_graph, get_obstacle_array
+import numpy as np
+import hashlib
+import os
+import tempfile
+
+FILE_MAGIC = b'PFGRAPH'
+FILE_VERSION = 2
+HEADER = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('reserved', '<u4'),
+    ('vertex_count', '<u8'), ('edge_count', '<u8')])
+
+
+def get_graph_file_name(obstacles, method='pairwise', reduced=False):
+    """
+    Returns a name of the file storing the visibility graph for given obstacles.
+
+    The name is a hash of obstacle coordinates and the way the graph
+    is created. Obstacles are expected to be in configuration space
+    (inflated by the size of an Agent), so the size of the Agent is
+    a part of the hash as well.
+    """
+    content = hashlib.sha256()
+    content.update(get_obstacle_array(obstacles).astype('<f8').tobytes())
+    content.update(repr((method, reduced, FILE_VERSION)).encode())
+    return content.hexdigest()[:32] + '.graph'
+
+
+def save_visibility_graph(graph, file_name):
+    """
+    Saves an IndexedVisibilityGraph to a binary file.
+
+    The file starts with a header (see HEADER) followed by the arrays
+    of the graph: coordinates, offsets, neighbour ids and distances.
+    Neighbour ids are stored as 32-bit integers, like in memory.
+    The file is written to a temporary location first and then moved,
+    so other processes never see a partially written file.
+    """
+    header = np.zeros(1, dtype=HEADER)
+    header['magic'] = FILE_MAGIC
+    header['version'] = FILE_VERSION
+    header['vertex_count'] = len(graph.coordinates)
+    header['edge_count'] = len(graph.neighbour_ids)
+
+    directory = os.path.dirname(os.path.abspath(file_name))
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temporary_file:
+        temporary_file.write(header.tobytes())
+        temporary_file.write(np.ascontiguousarray(graph.coordinates, dtype='<f8').tobytes())
+        temporary_file.write(np.ascontiguousarray(graph.offsets, dtype='<i8').tobytes())
+        temporary_file.write(np.ascontiguousarray(graph.neighbour_ids, dtype='<i4').tobytes())
+        temporary_file.write(np.ascontiguousarray(graph.distances, dtype='<f8').tobytes())
+    os.replace(temporary_file.name, file_name)
+
+
+def read_visibility_graph(file_name):
+    """
+    Reads an IndexedVisibilityGraph saved by save_visibility_graph.
+
+    The arrays are memory-mapped (read-only) instead of being read,
+    so the pages of the file are loaded only when they are needed
+    and shared by all processes using the same file.
+    """
+    header = np.fromfile(file_name, dtype=HEADER, count=1)
+    if len(header) != 1 or header['magic'][0] != FILE_MAGIC:
+        raise ValueError('Not a visibility graph file: %s' % file_name)
+    if header['version'][0] != FILE_VERSION:
+        raise ValueError('Unsupported visibility graph file version: %d' % header['version'][0])
+    vertex_count = int(header['vertex_count'][0])
+    edge_count = int(header['edge_count'][0])
+
+    arrays = {}
+    offset = HEADER.itemsize
+    for name, dtype, shape in [
+            ('coordinates', '<f8', (vertex_count, 2)),
+            ('offsets', '<i8', (vertex_count + 1, )),
+            ('neighbour_ids', '<i4', (edge_count, )),
+            ('distances', '<f8', (edge_count, ))]:
+        if np.prod(shape):
+            arrays[name] = np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return IndexedVisibilityGraph(**arrays)
+
+
+def load_visibility_graph(obstacles, directory, method='pairwise', reduced=False):
+    """
+    Returns an IndexedVisibilityGraph for given obstacles, using the files in given directory as cache.
+
+    If the graph was saved before (by any process), it is read from
+    the file. Otherwise it is created and saved for later use.
+    """
+    file_name = os.path.join(directory, get_graph_file_name(obstacles, method, reduced))
+    try:
+        return read_visibility_graph(file_name)
+    except (FileNotFoundError, ValueError):
+        pass
+    graph = get_indexed_visibility_graph(obstacles, method, reduced)
+    os.makedirs(directory, exist_ok=True)
+    save_visibility_graph(graph, file_name)
+    return graph
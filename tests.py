@@ -1,5 +1,25 @@
 from unittest import TestCase
 from pathfinder import Obstacle, Point, find_path, line_crosses_obstacle, Agent
+from pathfinder import get_obstacle_array, segments_cross_obstacles
+from pathfinder import Adjacency, find_path_using_visibility_graph, create_visibility_graph_for_obstacles
+from pathfinder import create_visibility_graph, ObstacleGrid, find_paths, get_indexed_visibility_graph
+from pathfinder import find_path_using_shortest_path_table
+from pathfinder_async import AsyncPlanner
+from pathfinder_parallel import find_paths_in_parallel, SharedVisibilityGraph, attach_visibility_graph
+from pathfinder_benchmark import MAP_GENERATORS, run_benchmark, compare_results, generate_queries
+from pathfinder_storage import load_visibility_graph, get_graph_file_name, save_visibility_graph, read_visibility_graph
+from pathfinder import find_paths_using_indexed_graph, World, ConfigurationSpaceCache, CacheStatistics, Swarm
+from pathfinder import PathCache, PathSearch, collect_statistics, shortcut_path
+from pathfinder import VisibilityField, find_visible_vertices, LazyVisibilityGraph, get_obstacle_grid
+from pathfinder import find_endpoint_adjacencies
+from pathfinder_hierarchical import HierarchicalPlanner, get_path_length
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import math
+import threading
+import numpy as np
+import os
+import tempfile
 
 
 class FindingPathTests(TestCase):
@@ -65,6 +85,907 @@ class FindingPathTests(TestCase):
         self.assertEquals(path, [Point(265, 335), Point(265, 265), Point(284, 221)])
 
 
+class ObstacleGridTests(TestCase):
+    obstacles = (
+        Obstacle(1, 3, 1, 3),
+        Obstacle(0, 10, 20, 22),
+        Obstacle(15, 16, -5, 40),
+        Obstacle(30, 31, 30, 31),
+        Obstacle(4, 8, 4, 8),
+    )
+
+    def test_same_results_as_testing_all_obstacles(self):
+        grid = ObstacleGrid(self.obstacles, cell_size=2.5)
+        points = [
+            Point(x, y) for x in [-10, 0, 1, 2, 5, 8, 21, 30, 31, 50]
+            for y in [-10, 0, 1, 2, 3.5, 8, 15, 16, 30, 50]]
+
+        for start in points:
+            blocked = grid.find_blocked_segments(start, points)
+            expected = segments_cross_obstacles([start] * len(points), points, get_obstacle_array(self.obstacles))
+            self.assertEqual(blocked.tolist(), expected.any(axis=1).tolist())
+
+    def test_points_inside_obstacles(self):
+        grid = ObstacleGrid(self.obstacles, cell_size=2.5)
+        inside = grid.find_points_inside_obstacles([Point(2, 2), Point(3, 2), Point(21, 5), Point(50, 50), Point(0, 0)])
+        self.assertEqual(inside.tolist(), [True, False, True, False, False])
+
+    def test_points_hidden_from_rectangle(self):
+        grid = ObstacleGrid(self.obstacles, cell_size=2.5)
+        hidden = grid.find_points_hidden_from_rectangle(
+            [Point(2, 0), Point(-10, 0), Point(50, 50), Point(-30, 15.5), Point(0, 20)], Obstacle(20, 22, 0, 4))
+        self.assertEqual(hidden.tolist(), [True, True, False, False, False])
+
+    def test_segment_outside_grid(self):
+        grid = ObstacleGrid(self.obstacles)
+        blocked = grid.find_blocked_segments(Point(-10, -10), [Point(100, -10), Point(-10, -10)])
+        self.assertEqual(blocked.tolist(), [False, False])
+
+    def test_no_obstacles(self):
+        grid = ObstacleGrid(())
+        blocked = grid.find_blocked_segments(Point(0, 0), [Point(1, 1)])
+        self.assertEqual(blocked.tolist(), [False])
+
+
+class VisibilityGraphSearchTests(TestCase):
+    def test_prefers_shorter_path_with_more_nodes(self):
+        a, b, c, d = Point(0, 0), Point(1, 0.5), Point(2, 0), Point(1, -5)
+        graph = {
+            a: [Adjacency(1.5, b), Adjacency(3.5, c), Adjacency(6, d)],
+            b: [Adjacency(1.5, a), Adjacency(1.5, c)],
+            c: [Adjacency(3.5, a), Adjacency(1.5, b), Adjacency(6, d)],
+            d: [Adjacency(6, a), Adjacency(6, c)],
+        }
+
+        path = find_path_using_visibility_graph(a, c, graph)
+        self.assertEqual(path, [b, c])
+
+    def test_start_is_destination(self):
+        graph = {Point(0, 0): []}
+        path = find_path_using_visibility_graph(Point(0, 0), Point(0, 0), graph)
+        self.assertEqual(path, [])
+
+    def test_unreachable_destination(self):
+        a, b, c = Point(0, 0), Point(1, 0), Point(5, 5)
+        graph = {a: [Adjacency(1, b)], b: [Adjacency(1, a)], c: []}
+        path = find_path_using_visibility_graph(a, c, graph)
+        self.assertIsNone(path)
+
+
+class VisibilityGraphTests(TestCase):
+    obstacles = (
+        Obstacle(70, 90, 70, 700),
+        Obstacle(90, 510, 70, 90),
+        Obstacle(510, 530, 70, 400),
+        Obstacle(90, 300, 680, 700),
+        Obstacle(370, 540, 680, 700),
+        Obstacle(150, 360, 160, 180),
+        Obstacle(150, 170, 180, 380),
+        Obstacle(150, 290, 380, 400),
+        Obstacle(290, 310, 290, 550),
+        Obstacle(310, 500, 500, 520),
+        Obstacle(400, 450, 150, 250),
+        Obstacle(420, 480, 200, 300),
+    )
+
+    def get_edges(self, graph):
+        return {(point, adjacency.point) for point, adjacencies in graph.items() for adjacency in adjacencies}
+
+    def test_angular_culling_creates_the_same_graph(self):
+        pairwise_graph = create_visibility_graph_for_obstacles(self.obstacles, 'pairwise')
+        angular_graph = create_visibility_graph_for_obstacles(self.obstacles, 'angular')
+
+        self.assertEqual(set(angular_graph), set(pairwise_graph))
+        self.assertEqual(self.get_edges(angular_graph), self.get_edges(pairwise_graph))
+
+    def test_angular_culling_creates_the_same_graph_for_many_obstacles(self):
+        for name in ('random', 'maze'):
+            obstacles = MAP_GENERATORS[name](80, 1)
+            pairwise_graph = create_visibility_graph_for_obstacles(obstacles, 'pairwise')
+            angular_graph = create_visibility_graph_for_obstacles(obstacles, 'angular')
+            self.assertEqual(self.get_edges(angular_graph), self.get_edges(pairwise_graph))
+
+    def test_indexed_graph_has_the_same_edges(self):
+        graph = create_visibility_graph_for_obstacles(self.obstacles)
+        indexed_graph = get_indexed_visibility_graph(self.obstacles)
+        indexed_edges = {
+            (indexed_graph.nodes[i], indexed_graph.nodes[j])
+            for i in range(len(indexed_graph.nodes)) for _, j in indexed_graph.get_adjacencies(i)}
+
+        self.assertEqual(indexed_graph.nodes, sorted(graph))
+        self.assertEqual(indexed_edges, self.get_edges(graph))
+
+    def test_find_path_using_angular_culling(self):
+        obstacles = (Obstacle(-3, 1, 2, 3), )
+        path = find_path(Point(0, 0), Point(5, 0), obstacles, method='angular')
+        self.assertEqual(path, [Point(2, 1), Point(3, 1), Point(5, 0)])
+
+    def test_reduced_graph_is_smaller(self):
+        graph = create_visibility_graph_for_obstacles(self.obstacles)
+        reduced_graph = create_visibility_graph_for_obstacles(self.obstacles, reduced=True)
+
+        self.assertLess(len(self.get_edges(reduced_graph)), len(self.get_edges(graph)))
+        self.assertLessEqual(self.get_edges(reduced_graph), self.get_edges(graph))
+
+    def test_reduced_graph_skips_vertices_inside_obstacles(self):
+        obstacles = (Obstacle(0, 2, 0, 2), Obstacle(1, 3, 1, 3))
+        reduced_graph = create_visibility_graph_for_obstacles(obstacles, reduced=True)
+        self.assertNotIn(Point(2, 2), reduced_graph)
+        self.assertNotIn(Point(1, 1), reduced_graph)
+        self.assertIn(Point(0, 0), reduced_graph)
+
+    def test_reduced_graph_finds_the_same_paths(self):
+        path = find_path(Point(750, 290), Point(607, 324), self.obstacles, reduced=True)
+        self.assertEqual(path, find_path(Point(750, 290), Point(607, 324), self.obstacles))
+
+        obstacles = (
+            Obstacle(-3, 0.5, 1, 2),
+            Obstacle(-0.5, 3, 3, 4)
+        )
+        path = find_path(Point(0, 0), Point(5, 0), obstacles, 'angular', reduced=True)
+        self.assertEqual(path, [Point(1, 0.5), Point(2, 0.5), Point(3, -0.5), Point(4, -0.5), Point(5, 0)])
+
+    def test_start_and_destination_do_not_modify_cached_graph(self):
+        graph = create_visibility_graph_for_obstacles(self.obstacles)
+        edges = self.get_edges(graph)
+
+        for x in range(0, 800, 200):
+            find_path(Point(x, 30), Point(482, 231), self.obstacles)
+
+        self.assertNotIn(Point(482, 231), graph)
+        self.assertEqual(self.get_edges(graph), edges)
+
+    def test_graph_contains_start_and_destination(self):
+        start = Point(750, 290)
+        destination = Point(607, 324)
+        graph = create_visibility_graph(start, destination, self.obstacles)
+
+        self.assertIn(start, graph)
+        self.assertIn(destination, graph)
+        self.assertEqual(len(graph), len(create_visibility_graph_for_obstacles(self.obstacles)) + 2)
+        self.assertIn(destination, [adjacency.point for adjacency in graph[start]])
+        self.assertIn(start, [adjacency.point for adjacency in graph[Point(700, 300)]])
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            create_visibility_graph_for_obstacles(self.obstacles, 'unknown')
+
+
+class FindingManyPathsTests(TestCase):
+    obstacles = (
+        Obstacle(-3, 0.5, 1, 2),
+        Obstacle(-0.5, 3, 3, 4)
+    )
+
+    def test_paths_in_order_of_pairs(self):
+        pairs = [
+            (Point(0, 0), Point(5, 0)),
+            (Point(5, 0), Point(0, 0)),
+            (Point(0, 0), Point(0, 2)),
+            (Point(0, 0), Point(5, 0)),
+        ]
+        paths = find_paths(pairs, self.obstacles)
+        self.assertEqual(paths, [
+            [Point(1, 0.5), Point(2, 0.5), Point(3, -0.5), Point(4, -0.5), Point(5, 0)],
+            [Point(4, -0.5), Point(3, -0.5), Point(2, 0.5), Point(1, 0.5), Point(0, 0)],
+            [Point(0, 2)],
+            [Point(1, 0.5), Point(2, 0.5), Point(3, -0.5), Point(4, -0.5), Point(5, 0)],
+        ])
+
+    def test_same_paths_as_find_path(self):
+        obstacles = (
+            Obstacle(-2, 2, 1, 2),
+            Obstacle(-2, 2, 4, 5),
+            Obstacle(1, 2, 1, 5),
+            Obstacle(-2, -1, 1, 5)
+        )
+        pairs = [(Point(0, 0), Point(3, 0)), (Point(0, 0), Point(6, 1)), (Point(3, 3), Point(3, 3))]
+        for reduced in [False, True]:
+            paths = find_paths(pairs, obstacles, reduced=reduced)
+            self.assertEqual(paths, [find_path(start, destination, obstacles) for start, destination in pairs])
+
+    def test_no_pairs(self):
+        self.assertEqual(find_paths([], self.obstacles), [])
+
+    def test_bidirectional_search(self):
+        pairs = [
+            (Point(0, 0), Point(5, 0)),
+            (Point(5, 0), Point(0, 0)),
+            (Point(0, 0), Point(0, 2)),
+            (Point(1.5, 0), Point(5, 0)),
+        ]
+        self.assertEqual(find_paths(pairs, self.obstacles, bidirectional=True), find_paths(pairs, self.obstacles))
+
+    def test_bidirectional_search_finds_shortest_paths(self):
+        obstacles = MAP_GENERATORS['maze'](60, 3)
+        pairs = generate_queries(obstacles, 30, 4)
+        for path, bidirectional_path, (start, _) in zip(
+                find_paths(pairs, obstacles), find_paths(pairs, obstacles, bidirectional=True), pairs):
+            self.assertAlmostEqual(get_path_length(start, bidirectional_path), get_path_length(start, path))
+
+
+class AsyncPlanningTests(TestCase):
+    obstacles = (Obstacle(-3, 1, 2, 3), )
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def __init__(self):
+            super().__init__(max_workers=1)
+            self.submitted = 0
+            self.released = threading.Event()
+
+        def submit(self, function, *args):
+            self.submitted += 1
+
+            def wait_and_call():
+                self.released.wait(10)
+                return function(*args)
+            return super().submit(wait_and_call)
+
+    def test_finds_path(self):
+        async def plan():
+            planner = AsyncPlanner()
+            await planner.prepare(self.obstacles)
+            path = await planner.plan(Point(0, 0), Point(5, 0), self.obstacles)
+            planner.close()
+            return path
+
+        self.assertEqual(asyncio.run(plan()), find_path(Point(0, 0), Point(5, 0), self.obstacles))
+
+    def test_identical_queries_are_merged(self):
+        executor = self.CountingExecutor()
+        planner = AsyncPlanner(executor)
+
+        async def plan():
+            queries = [planner.plan(Point(0, 0), Point(5, 0), self.obstacles) for _ in range(3)]
+            queries = [asyncio.ensure_future(query) for query in queries]
+            await asyncio.sleep(0)
+            executor.released.set()
+            return await asyncio.gather(*queries)
+
+        paths = asyncio.run(plan())
+        planner.close()
+        self.assertEqual(executor.submitted, 1)
+        self.assertEqual(paths, [[Point(2, 1), Point(3, 1), Point(5, 0)]] * 3)
+
+    def test_previous_query_of_agent_is_cancelled(self):
+        executor = self.CountingExecutor()
+        planner = AsyncPlanner(executor)
+
+        async def plan():
+            first = asyncio.ensure_future(planner.plan(Point(0, 0), Point(5, 0), self.obstacles, agent='a'))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(planner.plan(Point(0, 0), Point(4, 3), self.obstacles, agent='a'))
+            await asyncio.sleep(0)
+            executor.released.set()
+            return await asyncio.gather(first, second, return_exceptions=True)
+
+        first_result, second_result = asyncio.run(plan())
+        planner.close()
+        self.assertIsInstance(first_result, asyncio.CancelledError)
+        self.assertEqual(second_result, [Point(4, 3)])
+
+    def test_only_query_of_agent_is_cancelled(self):
+        executor = self.CountingExecutor()
+        planner = AsyncPlanner(executor)
+
+        async def first_caller():
+            try:
+                await planner.plan(Point(0, 0), Point(5, 0), self.obstacles, agent='a')
+            except asyncio.CancelledError:
+                pass
+            cancelling = asyncio.current_task().cancelling()
+            return cancelling, await planner.plan(Point(0, 0), Point(4, 3), self.obstacles)
+
+        async def plan():
+            first = asyncio.ensure_future(first_caller())
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(planner.plan(Point(0, 0), Point(4, 3), self.obstacles, agent='a'))
+            await asyncio.sleep(0)
+            executor.released.set()
+            return await asyncio.gather(first, second)
+
+        (cancelling, first_path), second_path = asyncio.run(plan())
+        planner.close()
+        self.assertEqual(cancelling, 0)
+        self.assertEqual(first_path, [Point(4, 3)])
+        self.assertEqual(second_path, [Point(4, 3)])
+
+    def test_given_executor_is_not_shut_down(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        AsyncPlanner(executor).close()
+        self.assertEqual(executor.submit(sum, [1, 2]).result(), 3)
+        executor.shutdown()
+
+
+class UnreachableDestinationTests(TestCase):
+    walls = (
+        Obstacle(0, 1, 0, 10),
+        Obstacle(9, 10, 0, 10),
+        Obstacle(0, 10, 0, 1),
+        Obstacle(0, 10, 9, 10),
+        Obstacle(20, 22, 20, 22),
+        Obstacle(4, 6, 4, 6),
+    )
+
+    def test_components(self):
+        graph = get_indexed_visibility_graph(self.walls)
+        component_ids = graph.get_component_ids()
+        node_components = dict(zip(graph.nodes, component_ids.tolist()))
+
+        self.assertEqual(node_components[Point(4, 4)], node_components[Point(6, 6)])
+        self.assertEqual(node_components[Point(0, 0)], node_components[Point(20, 20)])
+        self.assertNotEqual(node_components[Point(4, 4)], node_components[Point(0, 0)])
+
+    def test_destinations_in_other_component_or_inside_obstacle(self):
+        pairs = [
+            (Point(2, 2), Point(30, 30)),
+            (Point(30, 30), Point(21, 21)),
+            (Point(2, 2), Point(8, 8)),
+            (Point(21, 21), Point(21, 21)),
+        ]
+        self.assertEqual(find_paths(pairs, self.walls), [None, None, [Point(4, 6), Point(8, 8)], []])
+
+    def test_search_finishes_immediately(self):
+        search = PathSearch(Point(2, 2), Point(30, 30), self.walls)
+        self.assertTrue(search.finished)
+        self.assertIsNone(search.run())
+
+
+class ParallelPathfindingTests(TestCase):
+    obstacles = (
+        Obstacle(-3, 0.5, 1, 2),
+        Obstacle(-0.5, 3, 3, 4)
+    )
+
+    def test_shared_graph(self):
+        graph = get_indexed_visibility_graph(self.obstacles)
+        with SharedVisibilityGraph(graph) as shared_graph:
+            attached_graph, blocks = attach_visibility_graph(shared_graph.description)
+            self.assertEqual(attached_graph.nodes, graph.nodes)
+            self.assertEqual(attached_graph.neighbour_ids.tolist(), graph.neighbour_ids.tolist())
+            self.assertEqual(attached_graph.get_adjacencies(3), graph.get_adjacencies(3))
+            del attached_graph
+            for block in blocks:
+                block.close()
+
+    def test_same_paths_as_find_paths(self):
+        pairs = [(Point(x, y), Point(5, 0)) for x in range(-2, 3) for y in range(-3, 4)]
+        paths = find_paths_in_parallel(pairs, self.obstacles, workers=2, chunk_size=4)
+        self.assertEqual(paths, find_paths(pairs, self.obstacles))
+
+
+class ShortestPathTableTests(TestCase):
+    def test_two_obstacles(self):
+        obstacles = (
+            Obstacle(-3, 0.5, 1, 2),
+            Obstacle(-0.5, 3, 3, 4)
+        )
+        path = find_path_using_shortest_path_table(Point(0, 0), Point(5, 0), obstacles)
+        self.assertEqual(path, [Point(1, 0.5), Point(2, 0.5), Point(3, -0.5), Point(4, -0.5), Point(5, 0)])
+
+    def test_shortest_path_around_two_obstacles(self):
+        obstacles = (
+            Obstacle(65, 325, 655, 725),
+            Obstacle(265, 335, 265, 575)
+        )
+        path = find_path_using_shortest_path_table(Point(750, 290), Point(607, 324), obstacles, reduced=True)
+        self.assertEqual(path, [Point(725, 325), Point(655, 325), Point(607, 324)])
+
+    def test_destination_visible(self):
+        obstacles = (Obstacle(-3, 1, 2, 3), )
+        path = find_path_using_shortest_path_table(Point(0, 0), Point(0, 5), obstacles)
+        self.assertEqual(path, [Point(0, 5)])
+
+    def test_no_path_available(self):
+        obstacles = (
+            Obstacle(-2, 2, 1, 2),
+            Obstacle(-2, 2, 4, 5),
+            Obstacle(1, 2, 1, 5),
+            Obstacle(-2, -1, 1, 5)
+        )
+        path = find_path_using_shortest_path_table(Point(0, 0), Point(3, 0), obstacles)
+        self.assertIsNone(path)
+
+    def test_start_is_destination(self):
+        obstacles = (Obstacle(-3, 1, 2, 3), )
+        path = find_path_using_shortest_path_table(Point(0, 0), Point(0, 0), obstacles)
+        self.assertEqual(path, [])
+
+
+class VisibilityGraphStorageTests(TestCase):
+    obstacles = (
+        Obstacle(-3, 0.5, 1, 2),
+        Obstacle(-0.5, 3, 3, 4)
+    )
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_saved_graph_is_the_same(self):
+        graph = get_indexed_visibility_graph(self.obstacles)
+        file_name = os.path.join(self.directory.name, 'test.graph')
+        save_visibility_graph(graph, file_name)
+
+        loaded_graph = read_visibility_graph(file_name)
+
+        self.assertIsInstance(loaded_graph.distances, np.memmap)
+        self.assertEqual(loaded_graph.nodes, graph.nodes)
+        for name, array in graph.get_arrays().items():
+            self.assertEqual(loaded_graph.get_arrays()[name].dtype, array.dtype)
+            self.assertEqual(loaded_graph.get_arrays()[name].tolist(), array.tolist())
+        edge_count = len(graph.neighbour_ids)
+        self.assertEqual(os.path.getsize(file_name), 32 + 16 * len(graph.nodes) + 8 * (len(graph.nodes) + 1) +
+                         12 * edge_count)
+
+    def test_load_creates_file_once(self):
+        file_name = os.path.join(self.directory.name, get_graph_file_name(self.obstacles))
+        load_visibility_graph(self.obstacles, self.directory.name)
+        self.assertTrue(os.path.exists(file_name))
+        modification_time = os.stat(file_name).st_mtime_ns
+
+        graph = load_visibility_graph(self.obstacles, self.directory.name)
+
+        self.assertEqual(os.stat(file_name).st_mtime_ns, modification_time)
+        path = find_paths_using_indexed_graph([(Point(0, 0), Point(5, 0))], self.obstacles, graph)[0]
+        self.assertEqual(path, [Point(1, 0.5), Point(2, 0.5), Point(3, -0.5), Point(4, -0.5), Point(5, 0)])
+
+    def test_file_name_depends_on_obstacles_and_method(self):
+        names = {
+            get_graph_file_name(self.obstacles),
+            get_graph_file_name(self.obstacles, reduced=True),
+            get_graph_file_name(self.obstacles, 'angular'),
+            get_graph_file_name(self.obstacles[:1]),
+        }
+        self.assertEqual(len(names), 4)
+
+    def test_invalid_file(self):
+        file_name = os.path.join(self.directory.name, 'invalid.graph')
+        with open(file_name, 'wb') as f:
+            f.write(b'not a graph')
+        with self.assertRaises(ValueError):
+            read_visibility_graph(file_name)
+
+
+class WorldTests(TestCase):
+    obstacles = VisibilityGraphTests.obstacles
+
+    def get_edges(self, graph):
+        return {(point, adjacency.point) for point, adjacencies in graph.items() for adjacency in adjacencies}
+
+    def assert_graph_is_repaired(self, world):
+        expected = create_visibility_graph_for_obstacles(world.get_obstacles())
+        self.assertEqual(set(world.get_visibility_graph()), set(expected))
+        self.assertEqual(self.get_edges(world.get_visibility_graph()), self.get_edges(expected))
+
+    def test_adding_obstacles(self):
+        world = World(self.obstacles[:6])
+        for obstacle in self.obstacles[6:]:
+            world.add_obstacle(obstacle)
+        self.assert_graph_is_repaired(world)
+
+    def test_removing_obstacles(self):
+        world = World(self.obstacles)
+        for obstacle_id in [10, 3, 7, 0]:
+            self.assertEqual(world.remove_obstacle(obstacle_id), self.obstacles[obstacle_id])
+        self.assert_graph_is_repaired(world)
+
+    def test_removing_obstacle_with_shared_corner(self):
+        world = World([Obstacle(0, 10, 0, 10), Obstacle(10, 20, 10, 20)])
+        world.remove_obstacle(0)
+        self.assertIn(Point(10, 10), world.get_visibility_graph())
+        self.assertNotIn(Point(0, 0), world.get_visibility_graph())
+        self.assert_graph_is_repaired(world)
+
+    def test_changes_on_random_map(self):
+        obstacles = MAP_GENERATORS['random'](40)
+        world = World(obstacles)
+        for obstacle_id in [5, 17, 30]:
+            world.remove_obstacle(obstacle_id)
+            self.assert_graph_is_repaired(world)
+            world.add_obstacle(obstacles[obstacle_id])
+            self.assert_graph_is_repaired(world)
+
+    def test_finding_path_after_changes(self):
+        world = World()
+        obstacle_id = world.add_obstacle(Obstacle(-10, 10, -1, 1))
+        self.assertEqual(world.find_path(Point(0, -20), Point(0, 20)), [Point(-1, -10), Point(-1, 10), Point(0, 20)])
+        world.remove_obstacle(obstacle_id)
+        self.assertEqual(world.find_path(Point(0, -20), Point(0, 20)), [Point(0, 20)])
+        self.assertEqual(world.version, 2)
+
+
+class SwarmTests(TestCase):
+    def test_moves_like_agents(self):
+        agents = [Agent(Point(0, 0), 1, 1, velocity) for velocity in [1, 2.5, 7]]
+        swarm = Swarm()
+        for agent in agents:
+            agent.path = [Point(3, 4), Point(3, -6), Point(10, -6)]
+            swarm.add_agent(agent.position, agent.velocity, agent.path)
+
+        for _ in range(20):
+            swarm.step()
+            for agent_id, agent in enumerate(agents):
+                agent.move_along_path()
+                self.assertAlmostEqual(swarm.get_position(agent_id).x, agent.position[0])
+                self.assertAlmostEqual(swarm.get_position(agent_id).y, agent.position[1])
+                self.assertEqual(swarm.get_path(agent_id), agent.path)
+
+    def test_arrival(self):
+        arrivals = []
+        swarm = Swarm(on_arrival=arrivals.append)
+        swarm.add_agent(Point(0, 0), 2, [Point(3, 0)])
+        swarm.add_agent(Point(0, 0), 5, [Point(3, 0)])
+        swarm.add_agent(Point(0, 0), 5)
+
+        self.assertEqual(swarm.step().tolist(), [1])
+        self.assertEqual(swarm.step().tolist(), [0])
+        self.assertEqual(swarm.step().tolist(), [])
+        self.assertEqual(arrivals, [1, 0])
+        self.assertFalse(swarm.is_moving(0))
+
+    def test_replacing_paths(self):
+        swarm = Swarm()
+        for i in range(20):
+            swarm.add_agent(Point(i, 0), 1, [Point(i, 10)])
+        for _ in range(10):
+            swarm.step()
+            for i in range(20):
+                swarm.set_path(i, [Point(i, 5), Point(i, 10), Point(i, 15)])
+
+        self.assertEqual(swarm.get_path(7), [Point(7, 5), Point(7, 10), Point(7, 15)])
+        self.assertEqual(swarm.get_position(7), Point(7, 5))
+        self.assertLessEqual(len(swarm.waypoints), 16 * 60)
+
+
+class PathSearchTests(TestCase):
+    obstacles = VisibilityGraphTests.obstacles
+
+    def test_complete_search(self):
+        search = PathSearch(Point(750, 290), Point(607, 324), self.obstacles)
+        path = search.run()
+
+        self.assertTrue(search.finished)
+        self.assertEqual(path, find_path(Point(750, 290), Point(607, 324), self.obstacles))
+        self.assertEqual(search.run(), path)
+
+    def test_search_in_parts(self):
+        search = PathSearch(Point(30, 30), Point(200, 300), self.obstacles)
+        partial_paths = []
+        while not search.finished:
+            partial_paths.append(search.run(max_expansions=3))
+
+        self.assertGreater(len(partial_paths), 2)
+        self.assertEqual(partial_paths[-1], find_path(Point(30, 30), Point(200, 300), self.obstacles))
+
+    def test_partial_path_leads_closer_to_destination(self):
+        search = PathSearch(Point(30, 30), Point(200, 300), self.obstacles)
+        path = search.run(max_expansions=1)
+
+        self.assertFalse(search.finished)
+        self.assertEqual(len(path), 1)
+        self.assertLess(
+            math.dist(path[-1], Point(200, 300)), math.dist(Point(30, 30), Point(200, 300)))
+        self.assertEqual(search.run(time_limit=0), path)
+
+    def test_no_path(self):
+        search = PathSearch(Point(0, 0), Point(0, 0.5), (Obstacle(-1, 1, -1, 1), ))
+        self.assertIsNone(search.run())
+        self.assertTrue(search.finished)
+
+
+class PathCacheTests(TestCase):
+    obstacles = (Obstacle(-3, 1, 2, 3), )
+
+    def test_repeated_query(self):
+        cache = PathCache()
+        path = cache.find_path(Point(0, 0), Point(5, 0), self.obstacles)
+        path.append(Point(10, 10))
+
+        self.assertEqual(cache.find_path(Point(0, 0), Point(5, 0), self.obstacles), [
+            Point(2, 1), Point(3, 1), Point(5, 0)])
+        self.assertEqual(cache.get_statistics(), CacheStatistics(1, 1, 0, 1, 1))
+
+    def test_snapped_endpoints(self):
+        cache = PathCache(snap_size=1)
+        cache.find_path(Point(0, 0), Point(5, 0), self.obstacles)
+
+        path = cache.find_path(Point(0.5, 0.2), Point(5.5, 0.5), self.obstacles)
+        self.assertEqual(path, [Point(2, 1), Point(3, 1), Point(5.5, 0.5)])
+        self.assertEqual(cache.hits, 1)
+
+    def test_snapped_path_is_not_reused_if_blocked(self):
+        obstacles = (Obstacle(-3, 1, 2, 3), Obstacle(0.1, 0.3, 4.6, 4.7))
+        cache = PathCache(snap_size=1)
+        cache.find_path(Point(0, 0), Point(4.9, 0.9), obstacles)
+
+        path = cache.find_path(Point(0, 0), Point(4.9, 0.1), obstacles)
+        self.assertEqual(path, find_path(Point(0, 0), Point(4.9, 0.1), obstacles))
+        self.assertEqual(cache.misses, 2)
+
+    def test_snapped_path_is_shortened(self):
+        cache = PathCache(snap_size=2, shortcut_paths=True)
+        cache.find_path(Point(0, 0.5), Point(5, 0.5), self.obstacles)
+
+        path = cache.find_path(Point(1.5, 1.9), Point(5, 0.5), self.obstacles)
+        self.assertEqual(path, [Point(5, 0.5)])
+        self.assertEqual(cache.hits, 1)
+
+    def test_least_recently_used_paths_are_removed(self):
+        cache = PathCache(max_entries=2)
+        for x in [5, 6, 5, 7]:
+            cache.find_path(Point(0, 0), Point(x, 0), self.obstacles)
+        self.assertEqual(cache.get_statistics(), CacheStatistics(1, 3, 1, 2, 2))
+
+        cache.invalidate(self.obstacles)
+        self.assertEqual(cache.get_statistics().entries, 0)
+
+
+class ConfigurationSpaceCacheTests(TestCase):
+    obstacles = (Obstacle(-3, 1, 2, 3), Obstacle(5, 8, -4, 0))
+
+    def test_agents_of_the_same_size_share_graph(self):
+        cache = ConfigurationSpaceCache()
+        obstacles, graph = cache.get_configuration_space(self.obstacles, 1, 2)
+        self.assertEqual(obstacles, (Obstacle(-5, 3, 1, 4), Obstacle(3, 10, -5, 1)))
+        self.assertIs(cache.get_configuration_space(self.obstacles, 1, 2)[1], graph)
+        self.assertIsNot(cache.get_configuration_space(self.obstacles, 2, 1)[1], graph)
+        self.assertIs(cache.get_obstacles(self.obstacles, 1, 2), obstacles)
+
+        statistics = cache.get_statistics()
+        self.assertEqual(statistics[:4], (2, 2, 0, 2))
+
+    def test_least_recently_used_entries_are_removed(self):
+        cache = ConfigurationSpaceCache(max_size=1)
+        cache.get_obstacles(self.obstacles, 1, 1)
+        cache.get_obstacles(self.obstacles, 2, 2)
+        cache.get_obstacles(self.obstacles, 1, 1)
+
+        self.assertEqual(cache.get_statistics(), CacheStatistics(
+            hits=0, misses=3, evictions=2, entries=1, size=2 * ConfigurationSpaceCache.OBSTACLE_SIZE))
+
+
+class BenchmarkTests(TestCase):
+    def test_maps_are_reproducible(self):
+        for map_type, generate_map in MAP_GENERATORS.items():
+            obstacles = generate_map(50, seed=3)
+            self.assertEqual(obstacles, generate_map(50, seed=3))
+            self.assertNotEqual(obstacles, generate_map(50, seed=4))
+            self.assertLess(abs(len(obstacles) - 50), 20, map_type)
+
+    def test_queries_avoid_obstacles(self):
+        obstacles = MAP_GENERATORS['random'](30)
+        queries = generate_queries(obstacles, 10)
+        self.assertEqual(len(queries), 10)
+        for start, destination in queries:
+            self.assertTrue(find_path(start, destination, ()))
+            self.assertFalse(ObstacleGrid(obstacles).find_points_inside_obstacles([start, destination]).any())
+
+    def test_benchmark_results(self):
+        run = run_benchmark('maze', 10, query_count=5, steps=5)
+        self.assertEqual(set(run['stages']), {
+            'configuration_space', 'visibility_graph', 'endpoint_visibility', 'search',
+            'move_along_path', 'swarm_step'})
+        self.assertEqual(run['paths_found'], 5)
+        self.assertGreater(run['memory']['visibility_graph_peak'], 0)
+
+        results = {'results': [run]}
+        slower_run = dict(run, stages=dict(run['stages'], search=run['stages']['search'] * 2 + 1))
+        self.assertEqual(compare_results(results, results), [])
+        self.assertEqual(len(compare_results(results, {'results': [slower_run]})), 1)
+
+    def test_benchmark_graph_options(self):
+        run = run_benchmark('rooms', 10, query_count=5, steps=5, measure_memory=False, method='angular', reduced=True)
+        self.assertEqual((run['method'], run['reduced']), ('angular', True))
+        self.assertEqual(run['paths_found'], 5)
+        self.assertLessEqual(run['edges'], run_benchmark('rooms', 10, query_count=5, steps=5)['edges'])
+
+        slower_run = dict(run, stages=dict(run['stages'], search=run['stages']['search'] * 2 + 1))
+        self.assertEqual(compare_results({'results': [dict(run, method='pairwise')]}, {'results': [slower_run]}), [])
+
+
+class StatisticsTests(TestCase):
+    obstacles = VisibilityGraphTests.obstacles[:10]
+
+    def test_statistics_of_find_path(self):
+        with collect_statistics() as statistics:
+            find_path(Point(750, 290), Point(607, 324), self.obstacles + (Obstacle(0, 1, 0, 1), ))
+            find_path(Point(750, 290), Point(30, 30), self.obstacles + (Obstacle(0, 1, 0, 1), ))
+
+        counters = statistics.counters
+        self.assertEqual((counters['graph_cache_misses'], counters['graph_cache_hits']), (1, 1))
+        self.assertGreater(counters['nodes_expanded'], 2)
+        self.assertGreaterEqual(counters['edges_relaxed'], counters['nodes_expanded'])
+        self.assertGreater(counters['intersection_tests'], 0)
+        self.assertGreater(counters['obstacles_culled'], 0)
+        self.assertEqual(set(statistics.stage_times), {'visibility_graph', 'endpoint_visibility', 'search'})
+        self.assertIn('search_time', statistics.as_dict())
+
+    def test_callback(self):
+        collected = []
+        with collect_statistics(collected.append) as statistics:
+            Agent(Point(30, 30), 5, 5).calculate_new_path(Point(200, 100), self.obstacles)
+            with collect_statistics():
+                find_path(Point(30, 30), Point(200, 100), self.obstacles)
+
+        self.assertEqual(collected, [statistics])
+        self.assertEqual(statistics.counters['configuration_space_cache_misses'], 1)
+        self.assertNotIn('graph_cache_hits', statistics.counters)
+
+    def test_nothing_is_collected_by_default(self):
+        with collect_statistics() as statistics:
+            pass
+        find_path(Point(30, 30), Point(200, 100), self.obstacles)
+        self.assertEqual(statistics.as_dict(), {})
+
+
+class HierarchicalPlannerTests(TestCase):
+    def test_paths_on_rooms_map(self):
+        obstacles = MAP_GENERATORS['rooms'](24, 0)
+        planner = HierarchicalPlanner(obstacles, 100)
+        grid = ObstacleGrid(obstacles)
+
+        for start, destination in generate_queries(obstacles, 20, 1):
+            path = planner.find_path(start, destination)
+            shortest_path = find_path(start, destination, obstacles)
+            self.assertEqual(path[-1], destination)
+            self.assertFalse(grid.find_blocked_segments([start] + path[:-1], path).any())
+            self.assertGreaterEqual(get_path_length(start, path), get_path_length(start, shortest_path) - 1e-6)
+            self.assertLess(get_path_length(start, path), 1.5 * get_path_length(start, shortest_path))
+
+    def test_path_within_one_region(self):
+        obstacles = (Obstacle(0, 10, 0, 10), Obstacle(30, 40, 30, 40), Obstacle(2, 4, 14, 16))
+        planner = HierarchicalPlanner(obstacles, 20)
+        self.assertEqual(planner.find_path(Point(12, 1), Point(18, 6)), [Point(14, 4), Point(18, 6)])
+
+    def test_unreachable_destination(self):
+        obstacles = (
+            Obstacle(0, 1, 0, 10),
+            Obstacle(9, 10, 0, 10),
+            Obstacle(0, 10, 0, 1),
+            Obstacle(0, 10, 9, 10),
+            Obstacle(30, 40, 30, 40),
+        )
+        planner = HierarchicalPlanner(obstacles, 8)
+        self.assertIsNone(planner.find_path(Point(5, 5), Point(20, 20)))
+        self.assertIsNone(planner.find_path(Point(20, 20), Point(35, 35)))
+        self.assertIsNotNone(planner.find_path(Point(20, 20), Point(25, 12)))
+
+    def test_points_outside_of_obstacles(self):
+        obstacles = (Obstacle(0, 10, 0, 10), Obstacle(20, 30, 20, 30))
+        planner = HierarchicalPlanner(obstacles, 10, shortcut_paths=True)
+        self.assertEqual(planner.find_path(Point(-5, 5), Point(15, 5)), [Point(0, 0), Point(10, 0), Point(15, 5)])
+        with self.assertRaises(ValueError):
+            planner.find_path(Point(-50, 0), Point(-5, 5))
+        with self.assertRaises(ValueError):
+            planner.find_path(Point(5, 5), Point(5, 50))
+
+        planner = HierarchicalPlanner(obstacles, 10, shortcut_paths=True, bounds=(-50, -50, 50, 50))
+        self.assertEqual(planner.find_path(Point(-50, 0), Point(-20, 40)), [Point(-20, 40)])
+        path = planner.find_path(Point(5, -50), Point(5, 50))
+        self.assertEqual(path[-1], Point(5, 50))
+        self.assertFalse(ObstacleGrid(obstacles).find_blocked_segments([Point(5, -50)] + path[:-1], path).any())
+
+        planner = HierarchicalPlanner((), 10, shortcut_paths=True, bounds=(0, 0, 100, 100))
+        self.assertEqual(planner.region_size, 10)
+        self.assertEqual(planner.find_path(Point(5, 5), Point(95, 95)), [Point(95, 95)])
+        self.assertEqual(planner.find_path(Point(-5, 0), Point(105, 0)), [Point(105, 0)])
+        with self.assertRaises(ValueError):
+            HierarchicalPlanner((), 10)
+
+
+class VisibilityFieldTests(TestCase):
+    obstacles = MAP_GENERATORS['rooms'](24, 0)
+
+    def test_vertices_are_visible_from_whole_cells(self):
+        field = VisibilityField(self.obstacles, get_indexed_visibility_graph(self.obstacles))
+        cells = self.check_cells(field)
+        self.assertGreater(len(cells), field.shape[0] * field.shape[1] // 3)
+
+    def test_cells_larger_than_obstacles(self):
+        obstacles = MAP_GENERATORS['random'](40, 0)
+        for cell_size in (20, 60):
+            field = VisibilityField(obstacles, get_indexed_visibility_graph(obstacles), cell_size)
+            self.assertGreater(len(self.check_cells(field)), 0)
+
+    def test_thin_obstacles(self):
+        obstacles = self.obstacles + (Obstacle(300, 301, 120, 500), Obstacle(200, 200, 600, 650))
+        field = VisibilityField(obstacles, get_indexed_visibility_graph(obstacles))
+        self.assertEqual(field.cell_size, get_obstacle_grid(obstacles).cell_size / 2)
+        self.check_cells(field)
+        pairs = generate_queries(obstacles, 10, 2)
+        for path, shortest_path, (start, _) in zip(
+                find_paths(pairs, obstacles, use_visibility_field=True), find_paths(pairs, obstacles), pairs):
+            self.assertAlmostEqual(get_path_length(start, path), get_path_length(start, shortest_path))
+
+    def check_cells(self, field):
+        """
+        Checks the vertices stored for cells against visibility from random points of those cells.
+
+        Vertices visible from whole cells have to be visible from all the
+        points and no vertex missing from both lists may be visible.
+        Returns the indices of cells with any vertices visible from whole cells.
+        """
+        generator = np.random.default_rng(0)
+        for cell in range(0, len(field.cell_offsets) - 1, 5):
+            corner = np.array(divmod(cell, field.shape[1]))
+            points = field.origin + field.cell_size * (corner + generator.random((8, 2)))
+            visible = find_visible_vertices(points, field.obstacles, field.graph)
+            ids = field.cell_vertex_ids[field.cell_offsets[cell]:field.cell_offsets[cell + 1]]
+            partial_ids = field.partial_vertex_ids[field.partial_offsets[cell]:field.partial_offsets[cell + 1]]
+            self.assertTrue(visible[:, ids].all())
+            visible[:, ids] = visible[:, partial_ids] = False
+            self.assertFalse(visible.any())
+        return np.flatnonzero(np.diff(field.cell_offsets))
+
+    def test_paths(self):
+        grid = ObstacleGrid(self.obstacles)
+        pairs = generate_queries(self.obstacles, 20, 1) + [(Point(-100, -100), Point(100, 100))]
+        shortest_paths = find_paths(pairs, self.obstacles)
+        for path, shortest_path, (start, destination) in zip(
+                find_paths(pairs, self.obstacles, use_visibility_field=True), shortest_paths, pairs):
+            self.assertEqual(path[-1], destination)
+            self.assertFalse(grid.find_blocked_segments([start] + path[:-1], path).any())
+            self.assertAlmostEqual(get_path_length(start, path), get_path_length(start, shortest_path))
+
+    def test_same_adjacencies_as_testing_all_vertices(self):
+        obstacles = MAP_GENERATORS['random'](40, 0)
+        field = VisibilityField(obstacles, get_indexed_visibility_graph(obstacles))
+        points = [start for start, _ in generate_queries(obstacles, 30, 4)]
+        expected = find_endpoint_adjacencies(points, obstacles, field.graph)
+        for adjacencies, expected_adjacencies in zip(field.find_endpoint_adjacencies(points), expected):
+            self.assertEqual({i for _, i in adjacencies}, {i for _, i in expected_adjacencies})
+
+    def test_invalid_cell_size(self):
+        with self.assertRaises(ValueError):
+            VisibilityField(self.obstacles, get_indexed_visibility_graph(self.obstacles), cell_size=0)
+
+
+class LazyVisibilityGraphTests(TestCase):
+    obstacles = MAP_GENERATORS['rooms'](24, 0)
+
+    def test_paths(self):
+        pairs = generate_queries(self.obstacles, 20, 1)
+        for reduced in (False, True):
+            graph = LazyVisibilityGraph(self.obstacles, reduced=reduced)
+            shortest_paths = find_paths(pairs, self.obstacles, reduced=reduced)
+            for paths in (find_paths_using_indexed_graph(pairs, self.obstacles, graph, reduced),
+                          find_paths(pairs, self.obstacles, reduced=reduced, lazy=True)):
+                for path, shortest_path, (start, destination) in zip(paths, shortest_paths, pairs):
+                    self.assertEqual(path[-1], destination)
+                    self.assertAlmostEqual(get_path_length(start, path), get_path_length(start, shortest_path))
+
+    def test_only_expanded_vertices_are_computed(self):
+        graph = LazyVisibilityGraph(self.obstacles)
+        start, destination = graph.nodes[0], graph.nodes[-1]
+        self.assertIsNotNone(find_paths_using_indexed_graph([(start, destination)], self.obstacles, graph)[0])
+        self.assertGreater(graph.expanded_count, 0)
+        self.assertLess(graph.expanded_count, len(graph.nodes))
+        self.assertIsNone(graph.indexed_graph)
+
+    def test_warm_up(self):
+        for method in ('pairwise', 'angular'):
+            graph = LazyVisibilityGraph(self.obstacles, method)
+            find_paths_using_indexed_graph(generate_queries(self.obstacles, 5, 2), self.obstacles, graph)
+            graph.warm_up(background=True).join()
+
+            expected_graph = get_indexed_visibility_graph(self.obstacles, method)
+            self.assertEqual(graph.expanded_count, len(graph.nodes))
+            for i in range(len(graph.nodes)):
+                self.assertEqual(sorted(graph.get_adjacencies(i)), sorted(expected_graph.get_adjacencies(i)))
+            self.assertTrue(np.array_equal(graph.indexed_graph.get_component_ids(), expected_graph.get_component_ids()))
+
+    def test_searching_during_warm_up(self):
+        graph = LazyVisibilityGraph(self.obstacles)
+        pairs = generate_queries(self.obstacles, 10, 3)
+        thread = graph.warm_up(background=True)
+        paths = find_paths_using_indexed_graph(pairs, self.obstacles, graph)
+        thread.join()
+        self.assertIsNotNone(graph.indexed_graph)
+        for path, shortest_path, (start, _) in zip(paths, find_paths(pairs, self.obstacles), pairs):
+            self.assertAlmostEqual(get_path_length(start, path), get_path_length(start, shortest_path))
+
+
 class ObstacleCrossingTests(TestCase):
     def test_through_the_middle(self):
         obstacle = Obstacle(1, 3, 1, 3)
@@ -90,6 +1011,14 @@ class ObstacleCrossingTests(TestCase):
         result = line_crosses_obstacle(p1, p2, obstacle)
         self.assertTrue(result)
 
+    def test_ending_in_vertex_in_both_directions(self):
+        obstacle = Obstacle(42.21165755827173, 43.61822858431988, 21.659939713061338, 25.76362304088383)
+        p1 = Point(61.58563562509128, 44.949106478873816)
+        p2 = Point(25.76362304088383, 43.61822858431988)
+
+        self.assertFalse(line_crosses_obstacle(p1, p2, obstacle))
+        self.assertFalse(line_crosses_obstacle(p2, p1, obstacle))
+
     def test_through_the_middle_reversed(self):
         obstacle = Obstacle(1, 3, 1, 3)
         p1 = Point(4, 4)
@@ -203,6 +1132,42 @@ class ObstacleCrossingTests(TestCase):
         self.assertFalse(result)
 
 
+class SegmentsCrossingObstaclesTests(TestCase):
+    def test_same_results_as_line_crosses_obstacle(self):
+        obstacles = (
+            Obstacle(1, 3, 1, 3),
+            Obstacle(265, 335, 265, 8000),
+            Obstacle(-2, 2, -2, 2),
+        )
+        segments = [
+            (Point(0, 0), Point(4, 4)),
+            (Point(0, 2), Point(4, 2)),
+            (Point(2, 4), Point(2, 0)),
+            (Point(0, 2.5), Point(3, 3.99)),
+            (Point(0, 1), Point(4, 1)),
+            (Point(1, 0), Point(1, 4)),
+            (Point(0, 2), Point(2, 4)),
+            (Point(1, 1), Point(0, 0)),
+            (Point(0, 2), Point(1, 2)),
+            (Point(-1, 2.5), Point(0, 2)),
+            (Point(0, 0), Point(2, 2)),
+            (Point(284, 221), Point(265, 265)),
+            (Point(425, 485), Point(265, 335)),
+            (Point(-3, -3), Point(3, 3)),
+            (Point(5, 5), Point(5, 5)),
+        ]
+        starts, ends = zip(*segments)
+
+        result = segments_cross_obstacles(starts, ends, get_obstacle_array(obstacles))
+
+        expected = [[line_crosses_obstacle(p1, p2, obs) for obs in obstacles] for p1, p2 in segments]
+        self.assertEqual(result.tolist(), expected)
+
+    def test_no_obstacles(self):
+        result = segments_cross_obstacles([Point(0, 0)], [Point(1, 1)], get_obstacle_array(()))
+        self.assertEqual(result.shape, (1, 0))
+
+
 class AgentTests(TestCase):
     def test_destination_too_far(self):
         agent = Agent(Point(0, 0), 1, 1, 1)
@@ -241,3 +1206,44 @@ class AgentTests(TestCase):
         agent.calculate_new_path(destination, obstacles)
 
         self.assertEqual(agent.path, [Point(655, 325), Point(575, 265), Point(482, 231)])
+
+        agent.calculate_new_path(destination, obstacles, use_visibility_field=True)
+
+        self.assertEqual(agent.path, [Point(655, 325), Point(575, 265), Point(482, 231)])
+
+    def test_long_path(self):
+        agent = Agent(Point(0, 0), 1, 1, 2)
+        agent.path = [Point(x, x % 2) for x in range(1, 1001)]
+
+        for _ in range(999):
+            agent.move_along_path()
+        self.assertEqual(agent.path, [Point(1000, 0)])
+        self.assertTrue(agent.is_moving())
+
+        agent.move_along_path()
+        self.assertEqual(agent.path, [])
+        self.assertFalse(agent.is_moving())
+
+    def test_no_path(self):
+        agent = Agent(Point(0, 0), 1, 1)
+        agent.path = None
+
+        agent.move_along_path()
+
+        self.assertIsNone(agent.path)
+        self.assertFalse(agent.is_moving())
+        self.assertEqual(agent.position, Point(0, 0))
+
+
+class ShortcutPathTests(TestCase):
+    obstacles = (Obstacle(-1, 1, 2, 3), )
+
+    def test_redundant_points_are_removed(self):
+        path = [Point(1, 2), Point(2, 1), Point(3, 1), Point(4, 2), Point(5, 0), Point(6, 0)]
+        self.assertEqual(shortcut_path(Point(0, 0), path, self.obstacles), [Point(4, 2), Point(6, 0)])
+
+    def test_shortest_path_is_not_changed(self):
+        path = find_path(Point(0, 0), Point(6, 0), self.obstacles)
+        self.assertEqual(shortcut_path(Point(0, 0), path, self.obstacles), path)
+        self.assertEqual(shortcut_path(Point(0, 0), [Point(6, 0)], self.obstacles), [Point(6, 0)])
+        self.assertIsNone(shortcut_path(Point(0, 0), None, self.obstacles))